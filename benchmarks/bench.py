@@ -0,0 +1,403 @@
+#! /usr/bin/python
+
+#
+# bench.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Benchmarks of module loading and navigation, run without a display.
+
+   A module directory with the requested number of modules and nested
+   module sets is generated, loaded with and without the module index, and
+   then navigated through with the interface running on the stub toolkit
+   in benchmarks/stubs.  Timings and memory use are printed as JSON.
+
+   Given a baseline from an earlier run, timings that got slower by more
+   than the tolerance are reported and the exit status is 1.
+"""
+
+import gc
+import json
+import optparse
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_DIR = os.path.dirname(BENCH_DIR)
+
+# the stub toolkit has to come before any real one
+sys.path[:0] = [os.path.join(BENCH_DIR, 'stubs'), TOP_DIR]
+
+import gobject
+import logging
+
+from firstboot.config import config
+from firstboot import loader as fbloader
+from firstboot import logconf
+from firstboot import modcache
+from firstboot import network
+
+PREFIX = 'bench_'
+
+MODULE_TEMPLATE = '''\
+import gtk
+from firstboot.constants import *
+from firstboot.module import Module
+
+class moduleClass(Module):
+    def __init__(self):
+        Module.__init__(self)
+        self.priority = %(priority)d
+        self.sidebarTitle = %(title)r
+        self.title = %(title)r
+
+    def apply(self, interface, testing=False):
+        return RESULT_SUCCESS
+
+    def createScreen(self):
+        self.vbox = gtk.VBox()
+        self.vbox.pack_start(gtk.Label(label=self.title))
+
+    def initializeUI(self):
+        pass
+%(extra)s'''
+
+DYNAMIC = '''
+    def shouldAppear(self):
+        return True
+'''
+
+SET_TEMPLATE = '''\
+import os
+from firstboot.moduleset import ModuleSet
+
+class moduleClass(ModuleSet):
+    def __init__(self):
+        ModuleSet.__init__(self)
+        self.priority = %(priority)d
+        self.sidebarTitle = %(title)r
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 %(subdir)r)
+'''
+
+
+def write_set(directory, name, opts, depth, counter):
+    """Write opts.set_size modules to directory, one of them a nested set if
+       depth allows.  Returns how many pages were written.
+    """
+    os.mkdir(directory)
+    pages = 0
+
+    for i in range(opts.set_size):
+        module = '%s%s_%03d' % (PREFIX, name, i)
+        path = os.path.join(directory, module + '.py')
+
+        if i == opts.set_size // 2 and depth > 1:
+            subdir = module + '_set'
+            with open(path, 'w') as fobj:
+                fobj.write(SET_TEMPLATE % {'priority': i, 'title': module,
+                                           'subdir': subdir})
+            pages += write_set(os.path.join(directory, subdir), module, opts,
+                               depth - 1, counter)
+            continue
+
+        counter[0] += 1
+        extra = DYNAMIC if counter[0] % opts.dynamic_every == 0 else ''
+        with open(path, 'w') as fobj:
+            fobj.write(MODULE_TEMPLATE % {'priority': i, 'title': module,
+                                          'extra': extra})
+        pages += 1
+
+    return pages
+
+
+def generate(directory, opts):
+    """Generate the module directory.  Returns the number of pages."""
+    counter = [0]
+    pages = 0
+    # spread the sets evenly over the top level
+    step = max(1, opts.modules // max(1, opts.sets))
+    sets = set(list(range(step // 2, opts.modules, step))[:opts.sets])
+
+    for i in range(opts.modules):
+        module = '%sm%04d' % (PREFIX, i)
+        path = os.path.join(directory, module + '.py')
+
+        if i in sets:
+            subdir = module + '_set'
+            with open(path, 'w') as fobj:
+                fobj.write(SET_TEMPLATE % {'priority': i, 'title': module,
+                                           'subdir': subdir})
+            pages += write_set(os.path.join(directory, subdir), module, opts,
+                               opts.depth, counter)
+            continue
+
+        counter[0] += 1
+        extra = DYNAMIC if counter[0] % opts.dynamic_every == 0 else ''
+        with open(path, 'w') as fobj:
+            fobj.write(MODULE_TEMPLATE % {'priority': i, 'title': module,
+                                          'extra': extra})
+        pages += 1
+
+    return pages
+
+
+def forget_modules():
+    """Make the next load import the generated modules again."""
+    for name in [n for n in sys.modules if n.startswith(PREFIX)]:
+        del sys.modules[name]
+
+    modcache._indexes.clear()
+
+
+class Timings:
+
+    def __init__(self):
+        self.samples = {}
+        self.peaks = {}
+
+    def time(self, name, func, *args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.time() - start)
+        return result
+
+    def peak(self, name, func, *args, **kwargs):
+        """Run func, recording the most memory allocated while it ran."""
+        if tracemalloc is None or not tracemalloc.is_tracing():
+            return func(*args, **kwargs)
+
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        self.peaks[name] = tracemalloc.get_traced_memory()[1] - start
+        return result
+
+    def report(self):
+        results = {}
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            results[name] = {'count': len(samples),
+                             'total': sum(samples),
+                             'mean': sum(samples) / len(samples),
+                             'median': ordered[len(ordered) // 2],
+                             'max': ordered[-1]}
+
+        return results
+
+
+def bench_loading(timings, module_dir, opts):
+    for _i in range(opts.repeat):
+        if os.path.exists(config.moduleCache):
+            os.unlink(config.moduleCache)
+        forget_modules()
+        gc.collect()
+        timings.time('load_cold', fbloader.Loader(
+            workers=opts.workers).load_modules, module_dir)
+
+    for _i in range(opts.repeat):
+        forget_modules()
+        gc.collect()
+        timings.time('load_warm', fbloader.Loader(
+            workers=opts.workers).load_modules, module_dir)
+
+    forget_modules()
+    return timings.peak('load_warm', fbloader.Loader(
+        workers=opts.workers).load_modules, module_dir)
+
+
+def at_last_page(interface):
+    return len(interface._controlStack) == 1 and \
+        interface._control.currentPage >= len(interface.moduleList) - 1
+
+
+def at_first_page(interface):
+    # no page to go back to at any level
+    return not any(c.history for c in interface._controlStack)
+
+
+def navigate(timings, modules, opts):
+    import firstboot.interface
+
+    interface = timings.time('interface_setup', firstboot.interface.Interface,
+                             moduleList=modules, testing=True)
+    timings.time('create_main_window', interface.createMainWindow)
+    timings.time('create_sidebar', interface.createSidebar)
+    timings.time('first_page', interface.run)
+
+    def forward():
+        while not at_last_page(interface):
+            timings.time('advance', interface.advance)
+            gobject.run_pending()
+
+    def back():
+        while not at_first_page(interface):
+            timings.time('back', interface._backClicked)
+            gobject.run_pending()
+
+    for _i in range(opts.repeat):
+        timings.peak('forward', forward)
+        timings.peak('back', back)
+
+    titles = [m.title for m in interface.moduleList]
+    for _i in range(opts.repeat):
+        for title in titles:
+            timings.time('title_to_page_num', interface.titleToPageNum,
+                         title, interface.moduleList)
+
+    # jumps between the plain modules of the top level, as modules do from
+    # apply
+    rand = random.Random(opts.seed)
+    pages = [m.title for m in interface.moduleList
+             if not firstboot.interface.is_module_set(m)]
+    for _i in range(opts.jumps):
+        timings.time('move_to_page_title', interface.moveToPage,
+                     moduleTitle=rand.choice(pages))
+        gobject.run_pending()
+
+    # jumps to any page, in and out of module sets
+    titles = []
+    def collect(moduleList):
+        for module in moduleList:
+            if firstboot.interface.is_module_set(module):
+                collect(module.moduleList)
+            else:
+                titles.append(module.title)
+    collect(interface._controlStack[0].moduleList)
+
+    for _i in range(opts.jumps):
+        timings.time('move_to_title', interface.moveToTitle,
+                     rand.choice(titles))
+        gobject.run_pending()
+
+    return interface
+
+
+def compare(report, baseline, tolerance):
+    """Return the timings that got slower than baseline by more than
+       tolerance, as (name, baseline median, median) tuples.
+    """
+    slower = []
+    for name, result in sorted(report['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None or not old['median']:
+            continue
+
+        if result['median'] > old['median'] * (1 + tolerance):
+            slower.append((name, old['median'], result['median']))
+
+    return slower
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--modules', type='int', default=300,
+                      help='number of modules at the top level')
+    parser.add_option('--sets', type='int', default=20,
+                      help='how many of them are module sets')
+    parser.add_option('--set-size', dest='set_size', type='int', default=10,
+                      help='number of modules in each set')
+    parser.add_option('--depth', type='int', default=2,
+                      help='how deep module sets are nested')
+    parser.add_option('--dynamic-every', dest='dynamic_every', type='int',
+                      default=10, help='every how many modules one defines '
+                      'shouldAppear, and so is never deferred')
+    parser.add_option('--repeat', type='int', default=5)
+    parser.add_option('--jumps', type='int', default=200)
+    parser.add_option('--workers', type='int', default=1)
+    parser.add_option('--prefetch', type='int', default=1)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('-o', '--output', help='write the results to a file')
+    parser.add_option('--baseline', help='results of an earlier run to '
+                      'compare with')
+    parser.add_option('--tolerance', type='float', default=0.25,
+                      help='allowed slowdown against the baseline, as a '
+                      'fraction')
+    parser.add_option('-v', '--verbose', action='store_true', default=False)
+    opts, args = parser.parse_args()
+
+    logconf.setup(logging.DEBUG if opts.verbose else logging.WARNING)
+
+    # the peaks can only be measured per phase if they can be reset
+    if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.start()
+
+    workdir = tempfile.mkdtemp(prefix='firstboot-bench-')
+    try:
+        module_dir = os.path.join(workdir, 'modules')
+        os.mkdir(module_dir)
+        pages = generate(module_dir, opts)
+
+        config.moduleCache = os.path.join(workdir, 'modules.json')
+        config.themeDir = config.defaultThemeDir = \
+            os.path.join(TOP_DIR, 'themes', 'default')
+        config.prefetchPages = opts.prefetch
+
+        # there are no network links to look at without ethtool
+        network._state = network.NetworkState(probe=lambda: ['bench0'])
+
+        timings = Timings()
+        modules = bench_loading(timings, module_dir, opts)
+        navigate(timings, modules, opts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'python': platform.python_version(),
+        'parameters': dict(vars(opts), pages=pages),
+        'results': timings.report(),
+        'memory': {
+            # kilobytes on Linux
+            'maxrss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'peak_bytes': timings.peaks or None,
+        },
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if opts.output:
+        with open(opts.output, 'w') as fobj:
+            fobj.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    if opts.baseline:
+        with open(opts.baseline) as fobj:
+            baseline = json.load(fobj)
+
+        slower = compare(report, baseline, opts.tolerance)
+        for name, old, new in slower:
+            sys.stderr.write('%s got slower: median %.6fs, was %.6fs\n'
+                             % (name, new, old))
+        if slower:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#! /usr/bin/python
+
+#
+# pwbench.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Throughput of checking passwords in bulk with firstboot.pwpolicy.
+
+   Random (username, password) pairs, a mix of weak and strong passwords,
+   are checked one at a time as the UI does, and with evaluate() using
+   pools of each of the requested sizes.  The pairs checked per second are
+   printed as JSON.
+"""
+
+import json
+import optparse
+import os
+import platform
+import random
+import string
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from firstboot import pwpolicy
+
+WORDS = ['password', 'firstboot', 'kiosk', 'welcome', 'admin', 'summer',
+         'letmein', 'dragon', 'monkey', 'qwerty']
+
+
+def generate(count, seed):
+    rand = random.Random(seed)
+    chars = string.ascii_letters + string.digits + string.punctuation
+
+    pairs = []
+    for i in range(count):
+        username = 'user%05d' % i
+        kind = rand.random()
+        if kind < 0.3:
+            password = rand.choice(WORDS) + str(rand.randint(0, 99))
+        elif kind < 0.4:
+            password = username
+        else:
+            password = ''.join(rand.choice(chars)
+                               for _i in range(rand.randint(6, 16)))
+        pairs.append((username, password))
+
+    return pairs
+
+
+def run(pairs, processes, chunksize):
+    start = time.time()
+    results = [r for r in pwpolicy.evaluate(pairs, processes, chunksize)]
+    elapsed = time.time() - start
+
+    return {'processes': processes,
+            'seconds': elapsed,
+            'pairs_per_second': len(results) / elapsed if elapsed else None,
+            'rejected': sum(1 for r in results if r.message)}
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--pairs', type='int', default=5000,
+                      help='number of (username, password) pairs to check')
+    parser.add_option('--processes', default='1,2,4',
+                      help='comma separated pool sizes to try')
+    parser.add_option('--chunksize', type='int', default=pwpolicy.CHUNKSIZE)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('-o', '--output', help='write the results to a file')
+    opts, args = parser.parse_args()
+
+    pairs = generate(opts.pairs, opts.seed)
+
+    # one at a time, as the interface does, rebuilding the settings each
+    # time the way pwcheck used to
+    start = time.time()
+    for username, password in pairs[:min(len(pairs), 500)]:
+        pwpolicy._settings = None
+        pwpolicy.check(username, password)
+    uncached = min(len(pairs), 500) / (time.time() - start)
+
+    report = {
+        'python': platform.python_version(),
+        'parameters': vars(opts),
+        'uncached_pairs_per_second': uncached,
+        'results': [run(pairs, int(p), opts.chunksize)
+                    for p in opts.processes.split(',')],
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if opts.output:
+        with open(opts.output, 'w') as fobj:
+            fobj.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#
+# gobject.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""A stand-in for pygobject's main loop, for running the interface without
+   a display.  Sources are only dispatched when run_pending() is called.
+"""
+
+import itertools
+import threading
+
+IO_IN = 1
+IO_PRI = 2
+IO_HUP = 16
+
+_ids = itertools.count(1)
+_sources = {}
+_lock = threading.Lock()
+
+
+def _add(kind, func, args):
+    with _lock:
+        source = next(_ids)
+        _sources[source] = (kind, func, args)
+    return source
+
+def idle_add(func, *args, **kwargs):
+    return _add('idle', func, args)
+
+def timeout_add(interval, func, *args, **kwargs):
+    return _add('timeout', func, args)
+
+def timeout_add_seconds(interval, func, *args, **kwargs):
+    return _add('timeout', func, args)
+
+def io_add_watch(fd, condition, func, *args, **kwargs):
+    return _add('io', func, (fd, condition) + args)
+
+def source_remove(source):
+    with _lock:
+        return _sources.pop(source, None) is not None
+
+def threads_init():
+    pass
+
+
+def run_pending(timeouts=False):
+    """Dispatch the idle sources, and the timeouts too if asked, until
+       there are none left.  Returns how many callbacks were run.
+    """
+    kinds = ('idle', 'timeout') if timeouts else ('idle',)
+    count = 0
+
+    while True:
+        with _lock:
+            ready = sorted(s for s, (kind, f, a) in _sources.items()
+                           if kind in kinds)
+        if not ready:
+            return count
+
+        for source in ready:
+            with _lock:
+                if source not in _sources:
+                    continue
+                kind, func, args = _sources[source]
+
+            count += 1
+            if not func(*args):
+                source_remove(source)
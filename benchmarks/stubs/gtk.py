@@ -0,0 +1,184 @@
+#
+# gtk.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""A stand-in for pygtk, for running the interface without a display.
+
+   Containers keep their children and labels their text, since the
+   interface reads those back; any other method does nothing and returns
+   another stub.  Only what firstboot itself uses is provided.
+"""
+
+import sys
+import types
+
+
+class _Stub(object):
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return _Stub()
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+
+class _Rectangle(object):
+
+    def __init__(self, x=0, y=0, width=1024, height=768):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+class _Screen(_Stub):
+
+    def get_monitor_at_window(self, window):
+        return 0
+
+    def get_monitor_geometry(self, monitor):
+        return _Rectangle()
+
+
+class Widget(_Stub):
+
+    def __init__(self, *args, **kwargs):
+        self._children = []
+        self._label = kwargs.get('label')
+        self._sensitive = True
+        self._size = (-1, -1)
+
+    def add(self, child):
+        self._children.append(child)
+
+    def remove(self, child):
+        self._children.remove(child)
+
+    def pack_start(self, child, *args, **kwargs):
+        self._children.append(child)
+
+    def pack_end(self, child, *args, **kwargs):
+        self._children.append(child)
+
+    def reorder_child(self, child, position):
+        self._children.remove(child)
+        self._children.insert(position, child)
+
+    def get_children(self):
+        return list(self._children)
+
+    def destroy(self):
+        self._children = []
+
+    def get_label(self):
+        return self._label
+
+    def set_label(self, label):
+        self._label = label
+
+    def get_sensitive(self):
+        return self._sensitive
+
+    def set_sensitive(self, sensitive):
+        self._sensitive = sensitive
+
+    def get_size_request(self):
+        return self._size
+
+    def set_size_request(self, width, height):
+        self._size = (width, height)
+
+    def get_screen(self):
+        return _Screen()
+
+
+class Alignment(Widget): pass
+class Button(Widget): pass
+class EventBox(Widget): pass
+class HBox(Widget): pass
+class HButtonBox(Widget): pass
+class Image(Widget): pass
+class Label(Widget): pass
+class MessageDialog(Widget): pass
+class ProgressBar(Widget): pass
+class VBox(Widget): pass
+class Window(Widget): pass
+
+
+class _Pixbuf(_Stub):
+
+    def __init__(self, colorspace=None, has_alpha=True, bits=8, width=240,
+                 height=768):
+        self._width = width
+        self._height = height
+
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+    def get_rowstride(self):
+        return self._width * 4
+
+    def scale_simple(self, width, height, interp):
+        return _Pixbuf(width=width, height=height)
+
+
+gdk = types.ModuleType('gtk.gdk')
+gdk.COLORSPACE_RGB = 0
+gdk.INTERP_BILINEAR = 2
+gdk.SHIFT_MASK = 1
+gdk.WATCH = 150
+gdk.CairoContext = _Stub
+gdk.Cursor = _Stub
+gdk.Pixbuf = _Pixbuf
+gdk.colormap_get_system = _Stub
+gdk.display_get_default = _Stub
+gdk.get_default_root_window = _Stub
+gdk.pixbuf_new_from_file = lambda filename: _Pixbuf()
+gdk.screen_height = lambda: 768
+gdk.screen_width = lambda: 1024
+sys.modules['gtk.gdk'] = gdk
+
+keysyms = _Stub()
+
+BUTTONBOX_END = 4
+BUTTONS_OK = 1
+MESSAGE_INFO = 0
+WIN_POS_CENTER = 1
+WIN_POS_NONE = 0
+
+
+def events_pending():
+    return False
+
+def main():
+    pass
+
+def main_iteration(block=True):
+    return False
+
+def main_quit():
+    pass
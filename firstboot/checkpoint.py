@@ -0,0 +1,184 @@
+#
+# checkpoint.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Where firstboot got to, saved after every page applied so that it can
+   carry on from there if it is stopped before finishing.
+
+   Pages are saved by the qualified names of their modules rather than by
+   page number, as the pages loaded can differ from one start to the next,
+   for example when the network is up only one of the times.
+
+   The changes modules register to be made at the end can't be saved, so
+   firstboot carries on from the first page that registered one instead,
+   for its module to register it again.
+"""
+
+import errno
+import json
+import os
+import tempfile
+
+from .lazy import is_module_set
+from .navigation import History
+
+
+import logging
+log = logging.getLogger('firstboot.checkpoint')
+
+
+VERSION = 1
+
+
+def state(navigator, pending=()):
+    """Return the position of navigator and the qualified names of the
+       modules with changes pending, as saved by save().  The pages before
+       the position have all been applied, so resuming there skips them.
+    """
+    current = navigator.current
+    return {
+        'version': VERSION,
+        'current': current.qualifiedName if current is not None else None,
+        'history': [[control.moduleList[page].qualifiedName
+                     for page in control.history]
+                    for control in navigator.stack],
+        'pending': sorted(pending),
+    }
+
+
+def save(path, data):
+    """Replace the checkpoint at path with data, so that either the old or
+       the new checkpoint is found there, whenever the system goes down.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, tmp = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as fobj:
+            json.dump(data, fobj)
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+    # make the rename itself durable
+    dirfd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+
+def load(path):
+    """Return the checkpoint saved at path, or None if there is none that
+       can be used.
+    """
+    try:
+        with open(path) as fobj:
+            data = json.load(fobj)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            log.warning('could not read the checkpoint: %s', e)
+        return None
+    except ValueError as e:
+        log.warning('ignoring a damaged checkpoint: %s', e)
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        log.warning('ignoring a checkpoint of an unknown version')
+        return None
+
+    return data
+
+
+def remove(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _locate(moduleList, name, path=()):
+    # the page numbers of the sets containing name and of name itself
+    for pageNum, module in enumerate(moduleList):
+        if module.qualifiedName == name:
+            return path + (pageNum,)
+
+        if is_module_set(module):
+            found = _locate(module.moduleList, name, path + (pageNum,))
+            if found is not None:
+                return found
+
+    return None
+
+
+def restore(navigator, data):
+    """Move navigator to the page saved in data, with the history it had,
+       or to the first page with changes pending if that comes before.
+       Returns the page to show, or None if the page can't be found or
+       shown, in which case navigator is left at the first page.
+    """
+    if not data.get('current'):
+        return None
+
+    moduleList = navigator.stack[0].moduleList
+    location = _locate(moduleList, data['current'])
+    if location is None:
+        log.warning('page %s of the checkpoint is gone, starting over',
+                    data['current'])
+        return None
+
+    # Locations compare in the order pages are shown.
+    pending = [l for l in (_locate(moduleList, name)
+                           for name in data.get('pending', []))
+               if l is not None]
+    earlier = bool(pending) and min(pending) < location
+    if earlier:
+        location = min(pending)
+
+    name = _name(moduleList, location)
+    module = navigator.jump(location[:-1], location[-1])
+    if module is None or module.qualifiedName != name:
+        log.warning('page %s of the checkpoint cannot be shown, starting '
+                    'over', name)
+        navigator.setModuleList(moduleList)
+        return None
+
+    # Pages that are gone are left out of the history, and so are pages
+    # after the one moved to if that isn't the page saved.
+    for level, (control, names) in enumerate(zip(navigator.stack,
+                                                 data.get('history', []))):
+        pages = dict((m.qualifiedName, page)
+                     for (page, m) in enumerate(control.moduleList))
+        control.history = History(pages[n] for n in names
+                                  if n in pages and
+                                  not (earlier and pages[n] >= location[level]))
+
+    return module
+
+
+def _name(moduleList, location):
+    for pageNum in location[:-1]:
+        moduleList = moduleList[pageNum].moduleList
+
+    return moduleList[location[-1]].qualifiedName
@@ -0,0 +1,181 @@
+#
+# commit.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import threading
+import time
+
+from .concurrency import TaskGraph
+
+
+import logging
+log = logging.getLogger('firstboot.commit')
+
+
+# states of a journal entry
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CommitAction:
+
+    def __init__(self, name, func, after=(), description=None, module=None):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.description = description or name
+        self.module = module
+
+        self.state = PENDING
+        self.duration = None
+
+    def __repr__(self):
+        return '<CommitAction %s (%s)>' % (self.name, self.state)
+
+
+class CommitJournal:
+    """The system changes modules asked to be made when firstboot finishes,
+       instead of from their apply methods.
+
+       Each action has a name, unique among all the modules, and may name
+       the actions it has to run after.  Registering an action under a name
+       already used replaces it, so a page applied again after going back
+       doesn't add its actions twice.  Actions that don't depend on each
+       other are run at the same time.
+    """
+
+    def __init__(self):
+        self._actions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._actions)
+
+    def __iter__(self):
+        return iter(self._actions.values())
+
+    def register(self, name, func, after=(), description=None, module=None):
+        with self._lock:
+            self._actions.pop(name, None)
+            self._actions[name] = CommitAction(name, func, after, description,
+                                               module)
+
+    def cancel(self, name):
+        """Forget the action registered under name, if any."""
+        with self._lock:
+            self._actions.pop(name, None)
+
+    def plan(self):
+        """Return the actions grouped in steps: the actions of a step only
+           depend on actions of the steps before it, so the actions of one
+           step can all run at once.  Raises ValueError if an action
+           depends on an unknown action or on itself, through others.
+        """
+        with self._lock:
+            actions = self._actions.copy()
+
+        for action in actions.values():
+            for dep in action.after:
+                if dep not in actions:
+                    raise ValueError('commit action %s depends on unknown '
+                                     'action %s' % (action.name, dep))
+
+        steps = []
+        placed = set()
+        while len(placed) < len(actions):
+            step = [a for a in actions.values()
+                    if a.name not in placed and placed.issuperset(a.after)]
+            if not step:
+                left = [a for a in actions if a not in placed]
+                raise ValueError('commit actions depend on each other: %s'
+                                 % ', '.join(left))
+
+            steps.append(step)
+            placed.update(a.name for a in step)
+
+        return steps
+
+    def run(self, workers=None, progress=None):
+        """Run the actions, at most workers of them at once if given.  If
+           given, progress is called from the threads running the actions
+           as progress(action, finished, total) whenever an action starts
+           or finishes.  If an action fails, no new ones are started and
+           its exception is raised once the running ones are done.
+        """
+        steps = self.plan()
+        total = sum(len(step) for step in steps)
+        finished = [0]
+        lock = threading.Lock()
+
+        def wrap(action):
+            def run_action():
+                with lock:
+                    action.state = RUNNING
+                if progress is not None:
+                    progress(action, finished[0], total)
+
+                log.info('running commit action %s', action.name)
+                start = time.time()
+                try:
+                    result = action.func()
+                except Exception as e:
+                    log.error('commit action %s failed: %s', action.name, e)
+                    with lock:
+                        action.state = FAILED
+                    raise
+                finally:
+                    action.duration = time.time() - start
+
+                with lock:
+                    action.state = DONE
+                    finished[0] += 1
+                if progress is not None:
+                    progress(action, finished[0], total)
+
+                return result
+            return run_action
+
+        graph = TaskGraph()
+        for step in steps:
+            for action in step:
+                graph.add(action.name, wrap(action), after=action.after)
+
+        try:
+            return graph.run(workers)
+        finally:
+            log.info('commit actions took %.3fs, %.3fs less than running '
+                     'them one after another', graph.wallTime,
+                     graph.savedTime)
+
+    def report(self):
+        """Return a description of what run() would do, as text."""
+        lines = []
+        for i, step in enumerate(self.plan()):
+            lines.append('Step %d:' % (i + 1))
+            for action in step:
+                line = '  %s' % action.description
+                if action.module:
+                    line += ' (%s)' % action.module
+                if action.after:
+                    line += ', after %s' % ', '.join(action.after)
+                lines.append(line)
+
+        return '\n'.join(lines)
@@ -0,0 +1,184 @@
+#
+# concurrency.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import Queue
+import collections
+import sys
+import threading
+import time
+
+
+# set in the threads of parallel_map
+_local = threading.local()
+
+
+def parallel_map(func, items, workers=1):
+    """Return [func(item) for item in items], calling func from up to
+       workers threads at once.  The results keep the order of items.  If
+       any call raises, the first exception is raised again here once all
+       the threads are done.
+
+       Calls made from func run serially in the thread calling them, so
+       that nesting doesn't start more than workers threads in all.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1 or getattr(_local, 'worker', False):
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+
+    queue = Queue.Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+
+    def worker():
+        _local.worker = True
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                results[i] = func(item)
+            except Exception:
+                errors.append((i, sys.exc_info()))
+
+    threads = [threading.Thread(target=worker)
+               for _i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        # report the error the serial version would have hit first
+        i, (exc_type, exc_value, exc_tb) = min(errors, key=lambda e: e[0])
+        raise exc_type, exc_value, exc_tb
+
+    return results
+
+
+class TaskGraph:
+    """A set of named tasks, each run once all the tasks it depends on
+       have finished.  Tasks that are ready run at the same time in
+       threads, except those marked mainThread, which are run by the thread
+       that called run() (for code that has to, like signal handling).
+    """
+
+    def __init__(self):
+        self._tasks = collections.OrderedDict()
+
+        # filled in by run()
+        self.results = {}
+        self.durations = {}
+        self.wallTime = 0.0
+
+    def add(self, name, func, after=(), mainThread=False):
+        for dep in after:
+            if dep not in self._tasks:
+                raise ValueError('task %s depends on unknown task %s'
+                                 % (name, dep))
+
+        self._tasks[name] = (func, tuple(after), mainThread)
+
+    @property
+    def savedTime(self):
+        """How much shorter the last run was than running every task one
+           after another.
+        """
+        return max(0.0, sum(self.durations.values()) - self.wallTime)
+
+    def run(self, workers=None):
+        """Run all the tasks, with at most workers of them at once if given.
+           Returns a dictionary of their results by name.  If a task fails,
+           no new tasks are started and its exception is raised again once
+           the running ones are done.
+        """
+        pending = collections.OrderedDict(self._tasks)
+        running = set()
+        done = set()
+        errors = []
+        cond = threading.Condition()
+
+        def execute(name, func):
+            start = time.time()
+            try:
+                result, error = func(), None
+            except Exception:
+                result, error = None, sys.exc_info()
+
+            with cond:
+                self.durations[name] = time.time() - start
+                running.discard(name)
+                if error is None:
+                    self.results[name] = result
+                    done.add(name)
+                else:
+                    errors.append((name, error))
+                cond.notify_all()
+
+        start = time.time()
+        with cond:
+            while pending or running:
+                inline = None
+
+                if not errors:
+                    for name, (func, after, mainThread) in pending.items():
+                        if not done.issuperset(after):
+                            continue
+                        elif mainThread:
+                            inline = inline or name
+                            continue
+                        elif workers and len(running) >= workers:
+                            break
+
+                        del pending[name]
+                        running.add(name)
+                        thread = threading.Thread(target=execute,
+                                                  args=(name, func))
+                        thread.daemon = True
+                        thread.start()
+                elif not running:
+                    break
+
+                if inline is not None:
+                    func = pending.pop(inline)[0]
+                    running.add(inline)
+                    cond.release()
+                    try:
+                        execute(inline, func)
+                    finally:
+                        cond.acquire()
+                elif running:
+                    cond.wait()
+                else:
+                    # nothing can make progress, which add() prevents
+                    break
+
+        self.wallTime = time.time() - start
+
+        if errors:
+            name, (exc_type, exc_value, exc_tb) = errors[0]
+            raise exc_type, exc_value, exc_tb
+
+        return self.results
@@ -22,13 +22,21 @@ from constants import *
 
 class Config:
     def __init__(self):
+        self.asyncApply = False
+        self.checkpoint = CHECKPOINT
+        self.commitWorkers = 4
+        self.crashDumpDepth = CRASH_DUMP_DEPTH
+        self.crashDumpSize = CRASH_DUMP_SIZE
         self.defaultThemeDir = BASEDIR + "themes/default/"
         self.frontend = None
         self.interface = None
+        self.loaderWorkers = 1
         self.mode = MODE_REGULAR
+        self.moduleCache = MODULE_CACHE
         self.moduleDir = None
         self.moduleList = None
         self.needInterface = False
+        self.prefetchPages = 1
         self.themeDir = None
 
 config = Config()
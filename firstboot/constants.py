@@ -30,18 +30,38 @@ BASEDIR = "/usr/share/firstboot/"
 # new constants
 MODULE_DIR = '/usr/share/firstboot/modules'
 THEME_DIR = '/usr/share/firstboot/themes'
+CACHE_DIR = '/var/cache/firstboot'
+MODULE_CACHE = CACHE_DIR + '/modules.json'
+STATE_DIR = '/var/lib/firstboot'
+CHECKPOINT = STATE_DIR + '/checkpoint.json'
 
 I18N = '/etc/sysconfig/i18n'
 DISPLAY = ':9'
 VT = 'vt1'
+# seconds to wait for the X server to accept connections
+X_TIMEOUT = 60
 
 WMS = ('metacity',
        'kwin',
        'xfwm4',
        'openbox',
        'marco')
+WM_CACHE = CACHE_DIR + '/wm.json'
+# seconds to wait for the window manager to manage the screen
+WM_TIMEOUT = 10
 
 XRES = '/etc/X11/Xresources'
 
+# bytes a crash report is cut at, and how deep it follows references
+CRASH_DUMP_SIZE = 1024 * 1024
+CRASH_DUMP_DEPTH = 4
+
+LOG_FILE = '/var/log/firstboot.log'
+# bytes the log file is rotated at, and how many old ones are kept
+LOG_SIZE = 1024 * 1024
+LOG_BACKUPS = 3
+# records waiting to be written before more are dropped
+LOG_QUEUE_SIZE = 10000
+
 MODCLASS = 'moduleClass'
 
@@ -0,0 +1,193 @@
+#
+# crashdump.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Crash reports written straight to a file, within a size and a depth.
+
+   The report has the traceback with the local variables of each frame,
+   then the attributes of an object such as the global config, following
+   the objects they refer to down to the depth given.  Toolkit objects are
+   only named, values of attributes that look like secrets are left out,
+   and writing stops once the size given is reached, so a crash in a UI
+   holding many widgets costs little time and memory to report.
+"""
+
+import traceback
+import types
+
+from .constants import *
+
+
+# longest a single value is written
+MAX_REPR = 256
+
+# objects of these modules are only named
+TOOLKITS = ('gtk', 'gobject', 'gio', 'glib', 'pango', 'cairo', 'atk')
+
+# attributes whose values are never written
+SECRETS = ('password', 'passwd', 'secret', 'token')
+
+# values written without looking into them
+_SCALARS = (types.NoneType, bool, int, long, float, complex, str, unicode,
+            types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+            types.ModuleType, type, types.ClassType)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class DumpWriter:
+    """Writes a report to the file object fobj, at most max_size bytes of
+       it, following references at most max_depth deep.
+    """
+
+    def __init__(self, fobj, max_size=CRASH_DUMP_SIZE,
+                 max_depth=CRASH_DUMP_DEPTH):
+        self.fobj = fobj
+        self.max_size = max_size
+        self.max_depth = max_depth
+
+        self.written = 0
+        self.truncated = False
+        self._seen = set()
+
+    def write(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8', 'replace')
+
+        if self.written + len(text) > self.max_size:
+            text = text[:max(0, self.max_size - self.written)]
+            self.fobj.write(text)
+            self.written += len(text)
+            self.truncated = True
+            raise BudgetExceeded()
+
+        self.fobj.write(text)
+        self.written += len(text)
+
+    def _repr(self, value):
+        try:
+            text = repr(value)
+        except Exception as e:
+            text = '<repr failed: %s>' % e
+
+        if len(text) > MAX_REPR:
+            text = text[:MAX_REPR] + '...'
+        return text
+
+    def _summary(self, value):
+        cls = getattr(value, '__class__', type(value))
+        return '<%s.%s at 0x%x>' % (cls.__module__, cls.__name__, id(value))
+
+    def _children(self, value):
+        # (name, value) pairs to look into, or None for values to write as
+        # they are
+        if isinstance(value, dict):
+            return [('[%s]' % self._repr(k), v) for k, v in value.items()]
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            return [('[%d]' % i, v) for i, v in enumerate(value)]
+
+        attrs = getattr(value, '__dict__', None)
+        if isinstance(attrs, dict):
+            return sorted(attrs.items())
+
+        return None
+
+    def _secret(self, name):
+        name = name.lower()
+        return any(s in name for s in SECRETS)
+
+    def dump(self, name, value, depth=0):
+        """Write value under name, and what it refers to."""
+        indent = '  ' * depth
+
+        if self._secret(name):
+            self.write('%s%s: <hidden>\n' % (indent, name))
+            return
+
+        module = getattr(getattr(value, '__class__', None), '__module__', '')
+        if module and module.split('.')[0] in TOOLKITS:
+            self.write('%s%s: %s\n' % (indent, name, self._summary(value)))
+            return
+
+        if isinstance(value, _SCALARS):
+            self.write('%s%s: %s\n' % (indent, name, self._repr(value)))
+            return
+
+        if id(value) in self._seen:
+            self.write('%s%s: %s (seen above)\n' % (indent, name,
+                                                    self._summary(value)))
+            return
+
+        children = self._children(value)
+        if children is None:
+            self.write('%s%s: %s\n' % (indent, name, self._repr(value)))
+            return
+
+        self._seen.add(id(value))
+        if depth >= self.max_depth:
+            self.write('%s%s: %s (%d items not shown)\n'
+                       % (indent, name, self._summary(value), len(children)))
+            return
+
+        self.write('%s%s: %s\n' % (indent, name, self._summary(value)))
+        for child_name, child in children:
+            self.dump(child_name, child, depth + 1)
+
+    def traceback(self, exc_info):
+        """Write the traceback of exc_info, with the local variables of
+           each frame.
+        """
+        exc_type, exc_value, tb = exc_info
+        for line in traceback.format_exception(exc_type, exc_value, tb):
+            self.write(line)
+
+        self.write('\nLocal variables in innermost frames first:\n')
+        frames = []
+        while tb is not None:
+            frames.append(tb.tb_frame)
+            tb = tb.tb_next
+
+        for frame in reversed(frames):
+            code = frame.f_code
+            self.write('\n%s in %s:%d\n' % (code.co_name, code.co_filename,
+                                            frame.f_lineno))
+            for name, value in sorted(frame.f_locals.items()):
+                self.dump(name, value, 1)
+
+
+def write_report(fobj, exc_info, obj=None, name='config',
+                 max_size=CRASH_DUMP_SIZE, max_depth=CRASH_DUMP_DEPTH):
+    """Write the report of exc_info, and of obj under name if given, to the
+       file object fobj.  Returns whether it had to be cut short.
+    """
+    writer = DumpWriter(fobj, max_size, max_depth)
+    try:
+        writer.traceback(exc_info)
+        if obj is not None:
+            writer.write('\n\nDump of %s:\n' % name)
+            writer.dump(name, obj)
+    except BudgetExceeded:
+        pass
+
+    if writer.truncated:
+        # past the budget on purpose, so that the cut is visible
+        fobj.write('\n... report cut at %d bytes\n' % max_size)
+
+    return writer.truncated
@@ -19,25 +19,31 @@
 # Red Hat Author(s):  Martin Gracik <mgracik@redhat.com>
 #
 
+import ctypes
+import ctypes.util
+import errno
+import json
 import logging
 import os
+import select
 import shlex
-import signal
 import subprocess
+import tempfile
+import time
 
 from .constants import *
 
 
-# set up logging
-logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger('firstboot.frontend')
 
 
 class Frontend:
 
-    def __init__(self):
+    def __init__(self, x_timeout=X_TIMEOUT, wm_timeout=WM_TIMEOUT):
         self.x = None
+        self.x_timeout = x_timeout
         self.wm_pid = None
+        self.wm_timeout = wm_timeout
 
     def set_lang(self):
         try:
@@ -49,77 +55,208 @@ class Frontend:
         except:
             os.environ.setdefault("LANG", "en_US.UTF-8")
 
-    def startx(self):
-        def sigusr1_handler(num, frame):
-            pass
+    def available(self):
+        """Can an Xorg server be started?"""
+        return any(os.access(os.path.join(p, 'Xorg'), os.X_OK)
+                   for p in os.environ.get('PATH', '').split(':'))
+
+    def _wait_for_display(self, fd):
+        # Xorg writes the display number followed by a newline to the
+        # -displayfd descriptor once it accepts connections, or closes it
+        # by exiting.
+        deadline = time.time() + self.x_timeout
+        data = ''
+        while not data.endswith('\n'):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RuntimeError('Xorg server did not become ready within '
+                                   '%d seconds' % self.x_timeout)
 
-        def sigchld_handler(num, frame):
-            raise OSError
+            try:
+                ready, _w, _x = select.select([fd], [], [], remaining)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
 
-        def preexec_fn():
-            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            if not ready:
+                continue
 
-        old_sigusr1 = signal.signal(signal.SIGUSR1, sigusr1_handler)
-        old_sigchld = signal.signal(signal.SIGCHLD, sigchld_handler)
+            chunk = os.read(fd, 32)
+            if not chunk:
+                # give it a moment to be reaped, for the exit status
+                for _i in range(10):
+                    status = self.x.poll()
+                    if status is not None:
+                        break
+                    time.sleep(0.1)
+                raise RuntimeError('Xorg server exited before becoming ready '
+                                   '(status %s)' % status)
+            data += chunk
+
+        return data.strip()
+
+    def startx(self):
+        rd, wr = os.pipe()
 
         os.environ['DISPLAY'] = DISPLAY
         cmd = ['Xorg', os.environ['DISPLAY'],
-               '-ac', '-nolisten', 'tcp', VT]
+               '-ac', '-nolisten', 'tcp', '-noreset',
+               '-displayfd', str(wr), VT]
 
         devnull = os.open('/dev/null', os.O_RDWR)
 
         try:
             log.info('starting the Xorg server')
-            self.x = subprocess.Popen(cmd, stdout=devnull, stderr=devnull,
-                                      preexec_fn=preexec_fn)
+            try:
+                self.x = subprocess.Popen(cmd, stdout=devnull, stderr=devnull,
+                                          close_fds=False)
+            except OSError as e:
+                raise RuntimeError('Xorg server failed to start: %s' % e)
+            finally:
+                # only the server is to hold the write end, so that we see
+                # end of file if it exits
+                os.close(wr)
+                os.close(devnull)
 
-        except OSError as e:
-            err = 'Xorg server failed to start: %s' % e
-            log.critical(err)
-            raise RuntimeError(err)
+            display = self._wait_for_display(rd)
 
-        signal.pause()
-        signal.signal(signal.SIGUSR1, old_sigusr1)
-        signal.signal(signal.SIGCHLD, old_sigchld)
+        except RuntimeError as e:
+            log.critical(str(e))
+            if self.x is not None and self.x.poll() is None:
+                os.kill(self.x.pid, 15)
+                self.x.wait()
+            self.x = None
+            raise
 
-        log.info('Xorg server started successfully')
+        finally:
+            os.close(rd)
 
-        # XXX no need to close devnull?
+        if display:
+            os.environ['DISPLAY'] = ':%s' % display
+
+        log.info('Xorg server started successfully on %s', os.environ['DISPLAY'])
 
     def init_gtk(self):
-        rd, wr = os.pipe()
-        pid = os.fork()
-        if not pid:
-            import gtk
-            os.write(wr, '#')
+        # Xorg runs with -noreset, so there is no need to keep a client
+        # connected for it to stay up; just make sure gtk can use it.
+        import gtk
+        if gtk.gdk.display_get_default() is None:
+            err = 'gtk could not open the display %s' % os.environ['DISPLAY']
+            log.critical(err)
+            raise RuntimeError(err)
 
-            gtk.main()
-            os._exit(0)
+    def _path_state(self, path):
+        # the window managers found depend on what is in these directories
+        state = []
+        for p in path:
+            try:
+                state.append(os.stat(p).st_mtime)
+            except OSError:
+                state.append(None)
 
-        os.read(rd, 1)
-        os.close(rd)
-        os.close(wr)
+        return state
 
-    def start_wm(self):
+    def _find_wm(self):
         path = os.environ['PATH'].split(':')
+        state = self._path_state(path)
+
+        # reuse the last resolution unless something changed in PATH
+        try:
+            with open(WM_CACHE) as fobj:
+                cached = json.load(fobj)
+            if cached['path'] == path and cached['state'] == state and \
+               os.access(cached['wm'], os.X_OK):
+                return str(cached['wm'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
         wms = [os.path.join(p, wm) for wm in WMS for p in path]
         available = [wm for wm in wms if os.access(wm, os.X_OK)]
         if not available:
+            return None
+
+        wm = available[0]
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            fd, tmp = tempfile.mkstemp(prefix='.wm-', dir=CACHE_DIR)
+            with os.fdopen(fd, 'w') as fobj:
+                json.dump({'path': path, 'state': state, 'wm': wm}, fobj)
+            os.rename(tmp, WM_CACHE)
+        except (IOError, OSError) as e:
+            log.warning('could not save the window manager: %s', e)
+
+        return wm
+
+    def _wait_for_wm(self):
+        # An ICCCM compliant window manager owns the WM_Sn selection of the
+        # screen it manages.  This is asked through a connection of our own
+        # made with Xlib, so as not to depend on gtk from this thread.
+        libname = ctypes.util.find_library('X11')
+        if libname is None:
+            log.warning('libX11 not found, not waiting for the window manager')
+            return
+
+        xlib = ctypes.CDLL(libname)
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                                     ctypes.c_int]
+        xlib.XInternAtom.restype = ctypes.c_ulong
+        xlib.XGetSelectionOwner.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        xlib.XGetSelectionOwner.restype = ctypes.c_ulong
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+
+        dpy = xlib.XOpenDisplay(os.environ['DISPLAY'])
+        if not dpy:
+            log.warning('could not open the display to wait for the window '
+                        'manager')
+            return
+
+        try:
+            selection = xlib.XInternAtom(dpy,
+                                         'WM_S%d' % xlib.XDefaultScreen(dpy),
+                                         False)
+
+            deadline = time.time() + self.wm_timeout
+            while not xlib.XGetSelectionOwner(dpy, selection):
+                pid, status = os.waitpid(self.wm_pid, os.WNOHANG)
+                if pid:
+                    self.wm_pid = None
+                    raise RuntimeError('window manager exited with status %d'
+                                       % status)
+
+                if time.time() > deadline:
+                    log.warning('window manager did not manage the screen '
+                                'within %d seconds', self.wm_timeout)
+                    return
+
+                time.sleep(0.05)
+        finally:
+            xlib.XCloseDisplay(dpy)
+
+    def start_wm(self):
+        wm = self._find_wm()
+        if wm is None:
             err = 'no window manager available'
             log.critical(err)
             raise RuntimeError(err)
 
-        wm = available[0]
         cmd = [wm, '--display', os.environ['DISPLAY']]
 
+        log.info('starting the window manager %s', wm)
         self.wm_pid = os.fork()
         if not self.wm_pid:
-            log.info('starting the window manager')
-            os.execvp(wm, cmd)
+            try:
+                os.execvp(wm, cmd)
+            finally:
+                os._exit(1)
 
         try:
-            pid, status = os.waitpid(self.wm_pid, os.WNOHANG)
-        except OSError as e:
+            self._wait_for_wm()
+        except (OSError, RuntimeError) as e:
             err = 'window manager failed to start: %s' % e
             log.critical(err)
             raise RuntimeError(err)
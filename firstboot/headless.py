@@ -0,0 +1,170 @@
+#
+# headless.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Running the modules without a display, from an answer file.
+
+   The answer file has a section for each module, named after the module,
+   or for a module in a set after the set and the module as in
+   'set/module', holding the values the module would have asked for:
+
+     [create_user]
+     username = kiosk
+     fullname = Kiosk User
+
+   Each module is applied with its section's values, in the order the
+   pages would be shown.  Modules that can't be applied this way are
+   skipped and reported.
+"""
+
+import ConfigParser
+import time
+
+from .constants import *
+from .lazy import is_module_set
+from .profiling import profile
+from .tracing import span
+
+
+import logging
+log = logging.getLogger('firstboot.headless')
+
+
+def read_answers(path):
+    """Return the answers in the file at path, as a dict of dicts of
+       strings keyed by module.  Raises IOError or ConfigParser.Error if
+       the file can't be read.
+    """
+    parser = ConfigParser.RawConfigParser()
+    # the keys are up to the modules, so keep them as they are written
+    parser.optionxform = str
+
+    with open(path) as fobj:
+        parser.readfp(fobj)
+
+    return dict((section, dict(parser.items(section)))
+                for section in parser.sections())
+
+
+class Report:
+    """What happened to each module, as lists of their names."""
+
+    def __init__(self):
+        self.applied = []
+        self.skipped = []
+        self.offline = []
+        self.failed = []
+        self.notRun = []
+        self.unused = []
+        self.rebootRequired = False
+        self.duration = 0.0
+
+    @property
+    def success(self):
+        return not self.failed
+
+    def __str__(self):
+        lines = ['firstboot applied %d modules in %.3fs'
+                 % (len(self.applied), self.duration)]
+        for title, names in (
+                ('failed', self.failed),
+                ('not run after the failure', self.notRun),
+                ('skipped, no headless support', self.skipped),
+                ('skipped, no network', self.offline),
+                ('answers for unknown modules', self.unused)):
+            if names:
+                lines.append('%s: %s' % (title, ', '.join(names)))
+
+        if self.rebootRequired:
+            lines.append('a reboot is required')
+
+        return '\n'.join(lines)
+
+
+class HeadlessRunner:
+
+    def __init__(self, answers, testing=False):
+        self.answers = answers
+        self.testing = testing
+
+        self.report = Report()
+        self._used = set()
+
+    def _answers(self, module):
+        for key in (module.qualifiedName, module.name):
+            if key in self.answers:
+                self._used.add(key)
+                return self.answers[key]
+
+        return {}
+
+    def _apply(self, module):
+        name = module.qualifiedName
+
+        if self.report.failed:
+            self.report.notRun.append(name)
+            return
+
+        answers = self._answers(module)
+        try:
+            with span('applyHeadless', 'module', module=module.name), \
+                 profile(module, 'applyHeadless'):
+                result = module.applyHeadless(answers, self.testing)
+        except NotImplementedError:
+            log.info('module %s does not support headless mode', name)
+            self.report.skipped.append(name)
+            return
+        except Exception:
+            log.exception('module %s failed', name)
+            self.report.failed.append(name)
+            return
+
+        if result == RESULT_FAILURE:
+            log.error('module %s failed', name)
+            self.report.failed.append(name)
+            return
+
+        log.info('module %s applied', name)
+        self.report.applied.append(name)
+        if module.needsReboot():
+            self.report.rebootRequired = True
+
+    def _run(self, moduleList):
+        for module in moduleList:
+            if is_module_set(module):
+                self._run(module.moduleList)
+            else:
+                self._apply(module)
+
+    def run(self, modules, offline=()):
+        """Apply modules, and the modules in the sets among them, in order.
+           offline names the modules not loaded for lack of a network.
+           Returns the Report.
+        """
+        start = time.time()
+        self._run(modules)
+        self.report.duration = time.time() - start
+
+        self.report.offline.extend(offline)
+        self.report.unused.extend(sorted(set(self.answers) - self._used))
+        return self.report
+
+
+def run(modules, answers, testing=False, offline=()):
+    """Apply modules with answers, see HeadlessRunner.run."""
+    return HeadlessRunner(answers, testing).run(modules, offline)
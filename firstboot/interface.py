@@ -17,13 +17,24 @@
 # subject to the GNU General Public License and may only be used or replicated
 # with the express permission of Red Hat, Inc. 
 #
+import cairo
+import gobject
 import gtk
-import logging, os
+import functools, logging, os, sys, threading
 
+from firstboot import checkpoint
+from firstboot.commit import CommitJournal
 from firstboot.config import *
 from firstboot.constants import *
 from firstboot.functions import *
+from firstboot.lazy import is_module_set, wrap_module
 from firstboot.moduleset import *
+from firstboot.navigation import Navigator, TitleIndex
+from firstboot.profiling import profile
+from firstboot.theme import ThemeResolver
+from firstboot.tracing import span
+
+log = logging.getLogger('firstboot.interface')
 
 import gettext
 _ = lambda x: gettext.ldgettext("firstboot", x)
@@ -31,12 +42,6 @@ _ = lambda x: gettext.ldgettext("firstboot", x)
 # flag telling if reboot is required or not when done
 reboot_required = False
 
-class Control:
-    def __init__(self):
-        self.currentPage = 0
-        self.history = []
-        self.moduleList = []
-
 class Interface(object):
     def __init__(self, autoscreenshot=False, moduleList=[], testing=False):
         """Create a new Interface instance.  Instance attributes:
@@ -53,45 +58,154 @@ class Interface(object):
         self._screenshotDir = "/root/firstboot-screenshots"
         self._screenshotIndex = 0
 
-        # This is needed for ModuleSet to work.  We maintain a stack of control
-        # states, creating a new state for navigation when we enter into a
-        # ModuleSet, then popping it off when we leave.
-        self._controlStack = [Control()]
-        self._control = self._controlStack[0]
+        # This is needed for ModuleSet to work.  The navigator maintains a
+        # stack of control states, creating a new state for navigation when
+        # we enter into a ModuleSet, then popping it off when we leave.
+        self._nav = Navigator(realize=self._realize, removed=self._pageRemoved)
+        self._titleIndex = None
         self.moduleList = moduleList
 
         self._x_size = gtk.gdk.screen_width()
         self._y_size = gtk.gdk.screen_height()
 
+        # The sidebar background scaled to the screen height.
+        self._sidebarSurface = None
+
+        # All theme images are looked up through here.  The row of the
+        # sidebar the pointer is on is kept to avoid redrawing all of them.
+        self.theme = ThemeResolver(config.themeDir, config.defaultThemeDir)
+        self._pointerRow = None
+
         self.autoscreenshot = autoscreenshot
         self.testing = testing
 
+        # Whether apply is run in a thread of its own, for modules that
+        # allow it, so that the UI stays responsive.  While it runs, the
+        # module being applied is kept here and any moveToPage call made
+        # from the thread is kept in _pendingJump until apply is done.
+        # Like the commit thread, this relies on gobject.threads_init()
+        # having been called before the main loop starts.
+        self.asyncApply = config.asyncApply
+        self._mainThread = threading.current_thread()
+        self._applying = None
+        self._pendingJump = None
+
+        # System changes registered by modules with registerCommit, made
+        # once the last page has been applied.
+        self.commits = CommitJournal()
+        self.commitWorkers = config.commitWorkers
+        self._commitScreen = None
+        self._committed = False
+        self._commitError = None
+
+        # Where firstboot got to is saved here after every page applied,
+        # with the modules whose commits are pending, so that it can carry
+        # on from there after a crash.
+        self.checkpoint = None if testing else config.checkpoint
+        self._committers = set()
+        self._resumed = None
+
+        # How many of the upcoming pages to prepare in the background while
+        # the current one is displayed.
+        self.prefetchPages = config.prefetchPages
+        self._prefetchQueue = []
+        self._prefetchSource = None
+        self._prefetched = set()
+
     def _setModuleList(self, moduleList):
-        self._control.moduleList = moduleList
+        self._nav.setModuleList([wrap_module(m) for m in moduleList])
+        self._titleIndex = None
 
-    moduleList = property(lambda s: s._control.moduleList,
+    def _getTitleIndex(self):
+        # Built when first needed, and again after pages come or go.
+        if self._titleIndex is None:
+            self._titleIndex = TitleIndex(self._controlStack[0].moduleList)
+
+        return self._titleIndex
+
+    moduleList = property(lambda s: s._nav.moduleList,
                           lambda s, v: s._setModuleList(v))
 
+    _controlStack = property(lambda s: s._nav.stack)
+    _control = property(lambda s: s._nav.control)
+
     def _backClicked(self, *args):
-        # If there's nowhere to go back to, we're either at the first page in
-        # the module set or something went wrong (Back is enabled on the very
-        # first page).  In the former case, revert back to the enclosing
-        # control state for what page to display next.
-        if len(self._control.history) == 0:
-            if len(self._controlStack) == 1:
-                logging.error(_("Attempted to go back, but history is empty."))
-                return
-            else:
-                self._controlStack.pop()
-                self._control = self._controlStack[-1]
+        if self._applying is not None:
+            return
+
+        # If there's nowhere to go back to, something went wrong (Back is
+        # insensitive on the very first page).  At the first page of a module
+        # set, the navigator reverts back to the enclosing control states for
+        # what page to display next.
+        if not self._nav.canGoBack():
+            log.error(_("Attempted to go back, but history is empty."))
+            return
 
         # If we were previously on the last page, we need to set the Next
         # button's label back to normal.
         if self.nextButton.get_label() == _("_Finish"):
             self.nextButton.set_label("gtk-go-forward")
 
-        self._control.currentPage = self._control.history.pop()
-        self.moveToPage(pageNum=self._control.currentPage)
+        self._showPage(self._nav.back())
+
+    def _prefetchNext(self):
+        # Prepare one page per idle callback so the UI stays responsive.
+        while self._prefetchQueue:
+            module = self._prefetchQueue.pop(0)
+            if module in self._prefetched:
+                continue
+
+            try:
+                if not module.realize(self):
+                    continue
+
+                with span('prefetch', 'module', module=module.name):
+                    module.prefetch()
+            except Exception as e:
+                # This will be reported properly when the page is displayed.
+                log.debug("Prefetching module %s failed: %s" % (module.title, e))
+                continue
+
+            self._prefetched.add(module)
+            return True
+
+        self._prefetchSource = None
+        return False
+
+    def _schedulePrefetch(self):
+        if self._prefetchSource is not None:
+            gobject.source_remove(self._prefetchSource)
+            self._prefetchSource = None
+
+        self._prefetchQueue = self._upcomingPages(self.prefetchPages)
+        if self._prefetchQueue:
+            self._prefetchSource = gobject.idle_add(self._prefetchNext)
+
+    def _upcomingPages(self, count):
+        # The next count pages that moving forward would display, going
+        # into and out of module sets just like advance() does.
+        return self._nav.upcoming(count)
+
+    def _realize(self, module):
+        # Create the module's screen if that hasn't been done yet, logging
+        # whatever goes wrong.
+        try:
+            if module.realize(self):
+                return True
+        except Exception as e:
+            log.error(_("Module %s raised an exception while loading: %s" % (module.title, e)))
+            return False
+
+        log.error(_("Module %s did not set up its UI properly.") % module.title)
+        return False
+
+    def _pageRemoved(self, level, pageNum):
+        # The navigator dropped a page that can't be displayed.
+        self._titleIndex = None
+
+        if level == 0 and hasattr(self, "sidebar"):
+            self.sidebar.remove(self.sidebar.get_children()[pageNum])
+            self._pointerRow = None
 
     def _keyRelease(self, window, event):
         if event.keyval == gtk.keysyms.F12:
@@ -108,34 +222,59 @@ class Interface(object):
         self.advance()
 
     def _setBackSensitivity(self):
-        self.backButton.set_sensitive(not(self._control.currentPage == 0 and len(self._controlStack) == 1))
+        self.backButton.set_sensitive(self._nav.canGoBack() and
+                                      not(self._control.currentPage == 0 and len(self._controlStack) == 1))
 
     def _setPointer(self, number):
         # The sidebar pointer only works in terms of the top-level module list
         # as we don't display anything on the side for a ModuleSet and making
         # the pointer move around then would be confusing.
-        for i in range(len(self.sidebar.get_children())):
-            (alignment, label) = self.sidebar.get_children()[i].get_children()
+        rows = self.sidebar.get_children()
+
+        # Only the rows whose pointer changes need touching, unless rows
+        # were added or removed since the last time.
+        if self._pointerRow is None:
+            changed = range(len(rows))
+        else:
+            changed = [self._pointerRow, number]
+
+        for i in changed:
+            if i >= len(rows):
+                continue
+
+            (alignment, label) = rows[i].get_children()
             pix = alignment.get_children()[0]
 
             if i == number:
-                f = "%s/%s" % (config.themeDir, "pointer-white.png")
-                if os.access(f, os.F_OK):
-                    pix.set_from_file(f)
-                else:
-                    pix.set_from_file("%s/%s" % (config.defaultThemeDir, "pointer-white.png"))
+                pix.set_from_pixbuf(self.theme.pixbuf("pointer-white.png"))
             else:
-                f = "%s/%s" % (config.themeDir, "pointer-blank.png")
-                if os.access(f, os.F_OK):
-                    pix.set_from_file(f)
-                else:
-                    pix.set_from_file("%s/%s" % (config.defaultThemeDir, "pointer-blank.png"))
+                pix.set_from_pixbuf(self.theme.pixbuf("pointer-blank.png"))
+
+        self._pointerRow = number
 
     def _sidebarExposed(self, eb, event):
-        pixbuf = self.sidebarBg.scale_simple(int(self._y_size * self.aspectRatio),
-                                             self._y_size, gtk.gdk.INTERP_BILINEAR)
         cairo_context = eb.window.cairo_create()
-        cairo_context.set_source_pixbuf(pixbuf, 0, self._y_size-pixbuf.get_height())
+
+        # Scaling the background is expensive, so it's only done when the
+        # screen size changes.  The result is kept as a cairo surface
+        # compatible with the window so painting it needs no conversion.
+        if self._sidebarSurface is None:
+            pixbuf = self.sidebarBg.scale_simple(int(self._y_size * self.aspectRatio),
+                                                 self._y_size, gtk.gdk.INTERP_BILINEAR)
+            surface = cairo_context.get_target().create_similar(cairo.CONTENT_COLOR_ALPHA,
+                                                                pixbuf.get_width(),
+                                                                pixbuf.get_height())
+            surface_context = gtk.gdk.CairoContext(cairo.Context(surface))
+            surface_context.set_source_pixbuf(pixbuf, 0, 0)
+            surface_context.paint()
+            self._sidebarSurface = surface
+
+        # Only repaint what was damaged.
+        area = event.area
+        cairo_context.rectangle(area.x, area.y, area.width, area.height)
+        cairo_context.clip()
+
+        cairo_context.set_source_surface(self._sidebarSurface, 0, 0)
         cairo_context.paint()
         return False
 
@@ -144,12 +283,30 @@ class Interface(object):
            the history, and move to the next page.  It is not safe to call this
            method from within firstboot modules.
         """
+        # nothing is left to apply once the changes failed
+        if self._applying is not None or self._commitError is not None:
+            return
+
+        # Next on the commit screen shown in testing mode
+        if self._committed:
+            self._finish()
+            return
+
         module = self.moduleList[self._control.currentPage]
 
+        if self.asyncApply and getattr(module, "asyncApply", False):
+            self._applyAsync(module)
+            return
+
         # This could fail, in which case the exception will propagate up to the
         # interface which will know the proper way to handle it.
-        result = module.apply(self, self.testing)
+        with span('apply', 'module', module=module.name), \
+             profile(module, 'apply'):
+            result = module.apply(self, self.testing)
 
+        self._applied(result, module)
+
+    def _applied(self, result, module):
         # If something went wrong in the module, don't advance.
         if result == RESULT_FAILURE:
             return
@@ -165,8 +322,203 @@ class Interface(object):
                 if self._control.currentPage == len(self.moduleList)-1:
                     self.nextButton.set_label(_("_Finish"))
                 elif self._control.currentPage == len(self.moduleList):
-                    self.checkReboot()
-                    self.destroy()
+                    if len(self.commits) > 0:
+                        self._commit()
+                    else:
+                        self._finish()
+                    return
+
+        self._saveCheckpoint()
+
+    def _saveCheckpoint(self):
+        if self.checkpoint is None:
+            return
+
+        try:
+            checkpoint.save(self.checkpoint,
+                            checkpoint.state(self._nav, self._committers))
+        except (IOError, OSError) as e:
+            log.warning("Unable to save the checkpoint: %s" % e)
+
+    def resume(self, data):
+        """Carry on from a checkpoint saved by an earlier run that did not
+           finish, as returned by checkpoint.load().  The page saved is
+           displayed by run() instead of the first one.  Returns whether the
+           page could be found.
+        """
+        module = checkpoint.restore(self._nav, data)
+        if module is None:
+            return False
+
+        self._resumed = module
+        return True
+
+    def _finish(self):
+        if self.checkpoint is not None:
+            try:
+                checkpoint.remove(self.checkpoint)
+            except OSError as e:
+                log.warning("Unable to remove the checkpoint: %s" % e)
+
+        self.checkReboot()
+        self.destroy()
+
+    def _showCommitScreen(self, text):
+        if len(self.rightBox.get_children()) == 2:
+            self.rightBox.remove(self.rightBox.get_children()[0])
+
+        vbox = gtk.VBox(False, 10)
+        title = gtk.Label("")
+        title.set_markup("<span size='x-large'><b>%s</b></span>" % _("Applying your changes"))
+        title.set_alignment(0.0, 0.5)
+        vbox.pack_start(title, False)
+
+        self._commitLabel = gtk.Label(text)
+        self._commitLabel.set_alignment(0.0, 0.0)
+        self._commitLabel.set_line_wrap(True)
+        vbox.pack_start(self._commitLabel, True)
+
+        self._commitProgress = gtk.ProgressBar()
+        vbox.pack_start(self._commitProgress, False)
+
+        self._commitScreen = vbox
+        self.rightBox.pack_start(vbox)
+        self.win.show_all()
+
+    def _commit(self):
+        # In testing mode, only show what would be done and let Finish quit.
+        if self.testing:
+            report = self.commits.report()
+            log.info("Planned commit actions:\n%s" % report)
+            self._showCommitScreen(report)
+            self._commitProgress.hide()
+            self.backButton.set_sensitive(False)
+            self._committed = True
+            return
+
+        self._showCommitScreen("")
+        self._setBusy(True)
+        self._applying = self.commits
+
+        def progress(action, finished, total):
+            gobject.idle_add(self._commitProgressed, action, finished, total)
+
+        def run():
+            try:
+                self.commits.run(self.commitWorkers, progress)
+                error = None
+            except Exception:
+                error = sys.exc_info()
+
+            gobject.idle_add(self._commitDone, error)
+
+        thread = threading.Thread(target=run, name="commit")
+        thread.daemon = True
+        thread.start()
+
+    def _commitProgressed(self, action, finished, total):
+        running = [a.description for a in self.commits if a.state == "running"]
+        self._commitLabel.set_text("\n".join(running))
+        self._commitProgress.set_fraction(float(finished) / max(total, 1))
+        self._commitProgress.set_text("%d/%d" % (finished, total))
+        return False
+
+    def _commitDone(self, error):
+        self._applying = None
+
+        # There is no going on once a change failed.  The buttons stay
+        # insensitive and run() raises the error once the main loop is left,
+        # so that it is reported like any other crash and firstboot runs
+        # again the next time.
+        if error is not None:
+            self._commitError = error
+            self.destroy()
+            return False
+
+        self._setBusy(False)
+        self._committed = True
+        self._finish()
+        return False
+
+    def registerCommit(self, name, func, after=(), description=None):
+        """Register a system change to be made once all the pages have been
+           applied, instead of making it from apply.  Changes that don't
+           depend on each other are made at the same time, with a progress
+           screen shown; in testing mode, only a report of what would be
+           done is shown.  Arguments:
+
+           name        -- A name for the change, unique among all modules.
+                          Registering a change under the same name again,
+                          as when a page is applied a second time, replaces
+                          the earlier one.
+           func        -- Called without arguments to make the change, in a
+                          thread other than the main one, so it must not
+                          use gtk.
+           after       -- Names of the changes that have to be made first.
+           description -- Shown while the change is made.
+        """
+        if self._applying is not None and self._applying is not self.commits:
+            module = self._applying
+        else:
+            module = self.moduleList[self._control.currentPage]
+
+        self.commits.register(name, func, after, description, module.title)
+        self._committers.add(module.qualifiedName)
+
+    def cancelCommit(self, name):
+        """Forget the change registered under name, if any."""
+        self.commits.cancel(name)
+
+    def _applyAsync(self, module):
+        # Run apply in a thread, showing the UI as busy until the result is
+        # handed back to the main loop by _applyDone.
+        self._applying = module
+        self._setBusy(True)
+
+        def run():
+            try:
+                with span('apply', 'module', module=module.name), \
+                     profile(module, 'apply'):
+                    result = module.apply(self, self.testing)
+                error = None
+            except Exception:
+                result, error = None, sys.exc_info()
+
+            gobject.idle_add(self._applyDone, result, error)
+
+        thread = threading.Thread(target=run, name="apply %s" % module.name)
+        thread.daemon = True
+        thread.start()
+
+    def _applyDone(self, result, error):
+        module, self._applying = self._applying, None
+        self._setBusy(False)
+
+        jump, self._pendingJump = self._pendingJump, None
+
+        if error is not None:
+            # raised from here, it reaches the exception handler just like
+            # an exception from a synchronous apply
+            raise error[0], error[1], error[2]
+
+        if jump is not None:
+            jump()
+
+        self._applied(result, module)
+        return False
+
+    def _setBusy(self, busy):
+        if busy:
+            self.backButton.set_sensitive(False)
+            self.nextButton.set_sensitive(False)
+            cursor = gtk.gdk.Cursor(gtk.gdk.WATCH)
+        else:
+            self._setBackSensitivity()
+            self.nextButton.set_sensitive(True)
+            cursor = None
+
+        if self.win.window is not None:
+            self.win.window.set_cursor(cursor)
 
     def checkReboot(self):
         """Check to see if any module requires a reboot for changes to take
@@ -203,9 +555,12 @@ class Interface(object):
         screen = self.win.get_screen()
         monitor = screen.get_monitor_at_window(self.win.get_window())
         geometry = screen.get_monitor_geometry(monitor)
+        if (geometry.width, geometry.height) != (self._x_size, self._y_size):
+            self._sidebarSurface = None
+
         self._x_size = geometry.width
         self._y_size = geometry.height
-        logging.info("Setting size to %sx%s" % (self._x_size, self._y_size))
+        log.info("Setting size to %sx%s" % (self._x_size, self._y_size))
         self.win.set_size_request(self._x_size, self._y_size)
 
     def createMainWindow(self):
@@ -232,10 +587,7 @@ class Interface(object):
 
         # Load this background now so we can figure out how big to make
         # the left side.
-        try:
-            self.sidebarBg = loadPixbuf("%s/%s" % (config.themeDir, "firstboot-left.png"))
-        except:
-            self.sidebarBg = loadPixbuf("%s/%s" % (config.defaultThemeDir, "firstboot-left.png"))
+        self.sidebarBg = self.theme.pixbuf("firstboot-left.png")
 
         self.aspectRatio = (1.0 * self.sidebarBg.get_width()) / (1.0 * self.sidebarBg.get_height())
 
@@ -289,58 +641,65 @@ class Interface(object):
     def createScreens(self):
         """Call the createScreen method on all loaded modules.  This loads the
            UI elements for each page and stuffs the rendered page into a UI
-           wrapper containing the module's title and icon.
+           wrapper containing the module's title and icon.  Calling this is
+           optional, as pages are otherwise created the first time they are
+           about to be displayed.
         """
-        loaded_modules = []
+        with span('createScreens', 'interface'):
+            self.moduleList = self._createScreens(self.moduleList)
 
-        for module in self.moduleList:
-            try:
-                module.createScreen()
-            except Exception as e:
-                logging.error(_("Module %s raised an exception while loading: %s" % (module.title, e)))
-                continue
+        self._getTitleIndex()
 
-            if isinstance(module, Module) and module.vbox is None:
-                logging.error(_("Module %s did not set up its UI properly.") % module.title)
-                continue
+    def _createScreens(self, moduleList):
+        loaded_modules = []
 
-            try:
-                module.renderModule(self)
-            except Exception as e:
-                logging.error(_("Module %s raised an exception while rendering: %s" % (module.title, e)))
+        for module in moduleList:
+            if is_module_set(module):
+                module.moduleList[:] = self._createScreens(module.moduleList)
+                if not module.moduleList:
+                    continue
+            elif not self._realize(module):
                 continue
 
             loaded_modules.append(module)
 
-        self.moduleList = loaded_modules
+        return loaded_modules
 
-    def createSidebar(self):
-        """Add the sidebarTitle from every module to the sidebar."""
-        for module in self.moduleList:
-            hbox = gtk.HBox(False, 5)
+    def _addSidebarRow(self, module, position=None):
+        hbox = gtk.HBox(False, 5)
 
-            label = gtk.Label("")
-            label.set_markup("<span foreground='#FFFFFF'><b>%s</b></span>" % _(module.sidebarTitle))
-            label.set_alignment(0.0, 0.5)
+        label = gtk.Label("")
+        label.set_markup("<span foreground='#FFFFFF'><b>%s</b></span>" % _(module.sidebarTitle))
+        label.set_alignment(0.0, 0.5)
 
-            # Wrap the sidebar title if it's too long.
-            label.set_line_wrap(True)
-            (w, h) = self.leftEventBox.get_size_request()
-            label.set_size_request((int)(w*0.7), -1)
+        # Wrap the sidebar title if it's too long.
+        label.set_line_wrap(True)
+        (w, h) = self.leftEventBox.get_size_request()
+        label.set_size_request((int)(w*0.7), -1)
 
-            # Make sure the arrow is at the top of any wrapped line.
-            alignment = gtk.Alignment(yalign=0.2)
-            try:
-                alignment.add(loadToImage("%s/%s" % (config.themeDir, "pointer-blank.png")))
-            except:
-                alignment.add(loadToImage("%s/%s" % (config.defaultThemeDir, "pointer-blank.png")))
+        # Make sure the arrow is at the top of any wrapped line.
+        alignment = gtk.Alignment(yalign=0.2)
+        pix = gtk.Image()
+        pix.set_from_pixbuf(self.theme.pixbuf("pointer-blank.png"))
+        alignment.add(pix)
 
-            hbox.pack_start(alignment, False)
-            hbox.pack_end(label, True)
-            self.sidebar.pack_start(hbox, False, True, 3)
+        hbox.pack_start(alignment, False)
+        hbox.pack_end(label, True)
+        self.sidebar.pack_start(hbox, False, True, 3)
 
-        # Initialize sidebar pointer
-        self._setPointer(0)
+        if position is not None:
+            self.sidebar.reorder_child(hbox, position)
+
+        self._pointerRow = None
+
+    def createSidebar(self):
+        """Add the sidebarTitle from every module to the sidebar."""
+        with span('createSidebar', 'interface'):
+            for module in self.moduleList:
+                self._addSidebarRow(module)
+
+            # Initialize sidebar pointer
+            self._setPointer(0)
 
     def destroy(self, *args):
         """Destroy the UI, but do not take any other action to quit firstboot."""
@@ -364,88 +723,80 @@ class Interface(object):
         # screen for display.
         currentModule = self.moduleList[self._control.currentPage]
 
-        currentModule.initializeUI()
+        with span('initializeUI', 'module', module=currentModule.name), \
+             profile(currentModule, 'initializeUI'):
+            currentModule.initializeUI()
         if currentModule.vbox is None:
             err = _("Module %s did not setup its UI properly") % currentModule.title
-            logging.error(err)
+            log.error(err)
             raise RuntimeError, err
 
         self.rightBox.pack_start(currentModule.vbox)
         currentModule.focus()
         self.win.show_all()
 
+        # Once displayed, the module needs prefetching again before it is
+        # displayed the next time.
+        self._prefetched.discard(currentModule)
+        self._schedulePrefetch()
+
+    def insertModules(self, modules):
+        """Add modules to the top-level module list while the interface is
+           running, for example ones that need a network connection which
+           has just come up.  Each module is placed according to its
+           priority, but never before the page currently displayed.
+        """
+        top = self._controlStack[0]
+
+        for module in sorted(modules, key=lambda m: m.priority):
+            module = wrap_module(module)
+
+            pos = len(top.moduleList)
+            while pos > top.currentPage + 1 and \
+                  top.moduleList[pos-1].priority > module.priority:
+                pos -= 1
+
+            self._nav.insert(pos, module)
+            self._titleIndex = None
+            self._addSidebarRow(module, pos)
+
+        self._setPointer(top.currentPage)
+
+        # The last page may not be the last one anymore.
+        if len(self._controlStack) == 1 and \
+           top.currentPage < len(top.moduleList) - 1:
+            self.nextButton.set_label("gtk-go-forward")
+
     def moveToPage(self, moduleTitle=None, pageNum=None):
         """Move to and display the page given either by title or page number.
            This method raises SystemError if neither is provided, or if no
            page is found.  It is safe to call this method from within the apply
-           method of modules, unlike advance().
+           method of modules, unlike advance().  When apply runs in a thread
+           of its own, the move is made once apply returns.
         """
         if moduleTitle is None and pageNum is None:
-            logging.error(_("moveToPage must be given a module title or page number."))
+            log.error(_("moveToPage must be given a module title or page number."))
             raise SystemError, _("moveToPage must be given a module title or page number.")
 
+        if threading.current_thread() is not self._mainThread:
+            self._pendingJump = functools.partial(self.moveToPage, moduleTitle,
+                                                  pageNum)
+            return
+
         # If we were given a moduleTitle, look up the corresponding pageNum.
         # Everything else in firstboot is indexed by number.
         if moduleTitle is not None:
             pageNum = self.titleToPageNum(moduleTitle, self.moduleList)
 
-        # If we're at the end of a ModuleSet's module list, pop off the control
-        # structure and set up to move to the next page after the set.  If
-        # we're already at the top level, it's easy.
-        if pageNum == len(self.moduleList):
-            if len(self._controlStack) > 1:
-                oldFrame = self._controlStack.pop()
-                self._control = self._controlStack[-1]
-
-                # Put the ModuleSet's history into the object so we can keep
-                # the history should we go back into the set later on.  This
-                # is kind of a hack.
-                oldPage = self.moduleList[self._control.currentPage]
-                if isinstance(oldPage, ModuleSet):
-                    # Add the last page in the ModuleSet, since it will
-                    # otherwise be forgotten.  We don't append to the history
-                    # until later in this method.
-                    oldPage._history = oldFrame.history + [oldFrame.currentPage]
-
-                self.moveToPage(pageNum=self._control.currentPage+1)
-                return
-            else:
-                self._control.currentPage += 1
-                return
+        self._showPage(self._nav.moveTo(pageNum))
 
-        # Only add the current page to the history if we are moving forward.
-        # Adding it when we're going backwards traps us at the first page of
-        # a ModuleSet.
-        if pageNum > self._control.currentPage and not self._control.currentPage in self._control.history:
-            self._control.history.append(self._control.currentPage)
-
-        # Set this regardless so we know where we are on the way back out of
-        # a ModuleSet.
-        self._control.currentPage = pageNum
-
-        if isinstance(self.moduleList[pageNum], ModuleSet):
-            newControl = Control()
-            newControl.currentPage = 0
-            newControl.moduleList = self.moduleList[pageNum].moduleList
-
-            # If we are stepping back into a ModuleSet from somewhere after it, try
-            # to load any saved history.  This preserves the UI flow that you'd
-            # expect.
-            if hasattr(self.moduleList[pageNum], "_history"):
-                newControl.history = self.moduleList[pageNum]._history
-            else:
-                newControl.history = []
-
-            self._controlStack.append(newControl)
-            self._control = newControl
-
-            if len(newControl.history) > 0:
-                self.moveToPage(pageNum=self._control.history.pop())
-                return
-        else:
-            self._setBackSensitivity()
+    def _showPage(self, module):
+        # Display the page the navigator moved to, if any.
+        if module is None:
+            return
 
-        self._setPointer(self._controlStack[0].currentPage)
+        self._setBackSensitivity()
+        self._setPointer(self._nav.topPage)
         self.displayModule()
 
     def run(self):
@@ -456,11 +807,22 @@ class Interface(object):
            all interaction must take place in callbacks.
         """
 
-        self.displayModule()
+        if self._resumed is not None:
+            self._showPage(self._resumed)
+        else:
+            self.moveToPage(pageNum=0)
+        if self._control.currentPage >= len(self.moduleList):
+            log.error(_("No module could be displayed."))
+            return reboot_required
+
         self.win.present()
         self.nextButton.grab_focus()
         gtk.main()
 
+        if self._commitError is not None:
+            error, self._commitError = self._commitError, None
+            raise error[0], error[1], error[2]
+
         # a global flag (see self.checkReboot)
         return reboot_required
 
@@ -470,7 +832,7 @@ class Interface(object):
             try:
                 os.mkdir(self._screenshotDir)
             except:
-                logging.error(_("Unable to create the screenshot dir; skipping."))
+                log.error(_("Unable to create the screenshot dir; skipping."))
                 return
 
         screenshot = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8,
@@ -496,21 +858,49 @@ class Interface(object):
         """Lookup the given title in the given module list.  Returns the page
            number on success.  This only works on the given moduleList, so 
            for a ModuleSet it would only find the page if it exists in the
-           set.
+           set.  Use locateTitle to find a page anywhere.
         """
         if moduleTitle is None:
             return None
 
-        pageNum = 0
-
-        while True:
-            try:
-                if moduleList[pageNum].title == moduleTitle:
-                    break
+        index = self._getTitleIndex()
+        if index.knows(moduleList):
+            pageNum = index.page(moduleTitle, moduleList)
+        else:
+            pageNum = next((i for (i, m) in enumerate(moduleList)
+                            if m.title == moduleTitle), None)
 
-                pageNum += 1
-            except IndexError:
-                logging.error(_("No module exists with the title %s.") % moduleTitle)
-                raise SystemError, _("No module exists with the title %s.") % moduleTitle
+        if pageNum is None:
+            log.error(_("No module exists with the title %s.") % moduleTitle)
+            raise SystemError, _("No module exists with the title %s.") % moduleTitle
 
         return pageNum
+
+    def locateTitle(self, moduleTitle):
+        """Lookup the given title in the top-level module list and all the
+           ModuleSets it contains.  Returns a tuple of the set path, the page
+           numbers of the ModuleSets containing the page from the top level
+           down, and the page number within the innermost of them.  Raises
+           SystemError if no page has the title.
+        """
+        location = self._getTitleIndex().locate(moduleTitle)
+        if location is None:
+            log.error(_("No module exists with the title %s.") % moduleTitle)
+            raise SystemError, _("No module exists with the title %s.") % moduleTitle
+
+        return location
+
+    def moveToTitle(self, moduleTitle):
+        """Move to and display the page with the given title, which may be in
+           any ModuleSet, leaving and entering ModuleSets as needed.  This
+           method raises SystemError if no page is found.  Like moveToPage, it
+           is safe to call from within the apply method of modules.
+        """
+        if threading.current_thread() is not self._mainThread:
+            self.locateTitle(moduleTitle)
+            self._pendingJump = functools.partial(self.moveToTitle, moduleTitle)
+            return
+
+        (setPath, pageNum) = self.locateTitle(moduleTitle)
+
+        self._showPage(self._nav.jump(setPath, pageNum))
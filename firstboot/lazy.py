@@ -0,0 +1,160 @@
+#
+# lazy.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from .constants import *
+from .modcache import TYPE_MODULE, TYPE_SET
+from .moduleset import ModuleSet
+from .profiling import profile
+from .tracing import span
+
+
+import logging
+log = logging.getLogger('firstboot.lazy')
+
+
+def is_module_set(module):
+    """Is module a ModuleSet, or a LazyModule standing in for one?"""
+    if isinstance(module, LazyModule):
+        return module.isSet
+
+    return isinstance(module, ModuleSet)
+
+
+def wrap_module(module):
+    """Return module wrapped in an already loaded LazyModule, together with
+       anything it contains if it is a set.  LazyModules are returned as is.
+    """
+    if isinstance(module, LazyModule):
+        return module
+
+    if isinstance(module, ModuleSet):
+        module.moduleList[:] = [wrap_module(m) for m in module.moduleList]
+        entry = {'type': TYPE_SET}
+    else:
+        entry = {'type': TYPE_MODULE}
+
+    wrapped = LazyModule(module.__class__.__module__, entry, module=module)
+    wrapped.adopt()
+    return wrapped
+
+
+class LazyModule(object):
+    """Stand-in for a Module or ModuleSet in the interface's module lists.
+
+       The attributes needed to build the sidebar and to navigate (title,
+       sidebarTitle, priority, mode) are answered from the module index
+       until the real module is needed.  Everything else is forwarded to
+       the real module, which is imported and instantiated on first use.
+    """
+
+    def __init__(self, name, entry, module=None, factory=None):
+        self.name = name
+        self.parent = None
+        self.realized = False
+
+        self._entry = entry
+        self._module = module
+        self._factory = factory
+
+    def __getattr__(self, attr):
+        # only called for attributes the proxy itself doesn't have
+        if attr.startswith('__') or attr in ('_entry', '_factory', '_module'):
+            raise AttributeError(attr)
+
+        return getattr(self.module, attr)
+
+    def __repr__(self):
+        return '<LazyModule %s%s>' % (self.name,
+                                      '' if self.loaded else ' (not loaded)')
+
+    def _get(self, attr):
+        if self._module is not None:
+            return getattr(self._module, attr, None)
+
+        return self._entry[attr]
+
+    @property
+    def module(self):
+        if self._module is None:
+            log.info('loading module %s on demand', self.name)
+            self._module = self._factory()
+
+        return self._module
+
+    @property
+    def qualifiedName(self):
+        """The name of the module prefixed by those of the sets containing
+           it, as in 'set/module'.
+        """
+        if self.parent is None:
+            return self.name
+
+        return '%s/%s' % (self.parent.qualifiedName, self.name)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    @property
+    def isSet(self):
+        return self._entry['type'] == TYPE_SET
+
+    mode = property(lambda s: s._get('mode'))
+    priority = property(lambda s: s._get('priority'))
+    sidebarTitle = property(lambda s: s._get('sidebarTitle'))
+    title = property(lambda s: s._get('title'))
+
+    @property
+    def reconfig(self):
+        return self.mode == MODE_RECONFIG
+
+    def needsReboot(self):
+        # a module that was never loaded was never applied either
+        if self._module is None:
+            return False
+
+        return self._module.needsReboot()
+
+    def adopt(self):
+        """Make this the parent of the modules of the set it stands for."""
+        if self._module is not None and isinstance(self._module, ModuleSet):
+            for module in self._module.moduleList:
+                if isinstance(module, LazyModule):
+                    module.parent = self
+
+    def realize(self, interface):
+        """Create and render the module's screen unless that has been done
+           already.  Exceptions raised by the module are passed on.
+           Returns False if the module did not set up its UI.  This is not
+           meant for sets, whose contained modules are realized one by one.
+        """
+        if self.realized:
+            return True
+
+        module = self.module
+        with span('createScreen', 'module', module=self.name), \
+             profile(self, 'createScreen'):
+            module.createScreen()
+        if module.vbox is None:
+            return False
+
+        with span('renderModule', 'module', module=self.name):
+            module.renderModule(interface)
+        self.realized = True
+        return True
@@ -19,28 +19,50 @@
 # Red Hat Author(s):  Martin Gracik <mgracik@redhat.com>
 #
 
+import functools
 import operator
 import os
 import sys
+import threading
 
+from .concurrency import parallel_map
+from .config import config
 from .constants import *
+from .lazy import LazyModule
+from .modcache import TYPE_MODULE, get_index
 from .module import Module
 from .moduleset import ModuleSet
+from .network import get_state
+from .tracing import span
 
-import ethtool
 
-
-# set up logging
 import logging
-logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger('firstboot.loader')
 
 
+# module imports and sys.path changes are kept to one thread at a time
+_import_lock = threading.RLock()
+
+
 class Loader:
 
-    def __init__(self):
+    def __init__(self, workers=None):
         self.modlist = []
 
+        # results of discover(), by module directory and mode
+        self._discovered = {}
+
+        # modules skipped only because there was no network, kept so that
+        # they can be probed again once a link comes up
+        self.offline = []
+        self.index = get_index(config.moduleCache)
+
+        # how many modules may be probed at once; module sets probed in a
+        # worker load their own modules in that worker, one at a time
+        if workers is None:
+            workers = config.loaderWorkers
+        self.workers = workers
+
     def _check_module(self, module):
         # XXX this does not work as expected
         if isinstance(module, Module):
@@ -53,62 +75,196 @@ class Loader:
         return [a for a in attrs if getattr(module, a, None) is None]
 
     def _has_network(self):
-        return [i for i in ethtool.get_active_devices() if i != 'lo']
+        return get_state().has_network()
 
-    def load_modules(self, module_dir, reconfig=False):
-        if not module_dir in sys.path:
-            sys.path.append(module_dir)
+    def _import(self, module):
+        try:
+            imported = __import__(module)
+        except ImportError as e:
+            log.error('module could not be imported: %s', e)
+            return None
 
-        modules = [os.path.splitext(f)[0] for f in os.listdir(module_dir)
-                   if f.endswith('.py')]
+        clsobj = getattr(imported, MODCLASS, None)
+        if clsobj is None:
+            log.error('module does not implement the required class')
+            return None
 
-        for module in modules:
-            log.info('loading module %s', module)
-            try:
-                imported = __import__(module)
-            except ImportError as e:
-                log.error('module could not be imported: %s', e)
-                continue
+        return clsobj
 
-            clsobj = getattr(imported, MODCLASS, None)
-            if clsobj is None:
-                log.error('module does not implement the required class')
-                continue
+    def _instantiate(self, module):
+        with _import_lock:
+            with span('import', 'loader', module=module):
+                clsobj = self._import(module)
+        if clsobj is None:
+            raise RuntimeError('module %s could not be loaded' % module)
+
+        with span('__init__', 'loader', module=module):
+            return clsobj()
 
+    def _skip_indexed(self, entry, candidate):
+        # the same checks as below, answered from the module index so that
+        # modules which would be thrown away are not imported at all
+        if entry['missing']:
+            log.error('module has missing attributes: %s',
+                      str(entry['missing']))
+            return True
+
+        reconfig = candidate[-1]
+        if not reconfig and entry['mode'] == MODE_RECONFIG:
+            log.info('module only available in reconfig mode')
+            return True
+
+        if entry['needsNetwork'] and not self._has_network():
+            log.error('module requires active network connection')
+            self.offline.append(candidate)
+            return True
+
+        return False
+
+    def _probe(self, candidate):
+        # Import and instantiate a module and decide whether it is to be
+        # shown.  This runs in the worker threads when loading concurrently.
+        module, filename, st, reconfig = candidate
+
+        log.info('loading module %s', module)
+        with _import_lock:
+            with span('import', 'loader', module=module):
+                clsobj = self._import(module)
+        if clsobj is None:
+            return None
+
+        with span('__init__', 'loader', module=module):
             modobj = clsobj()
 
-            # module sanity check
-            missing = self._check_module(modobj)
-            if missing:
-                log.error('module has missing attributes: %s', str(missing))
-                continue
+        # module sanity check
+        missing = self._check_module(modobj)
+        entry = self.index.update(filename, st, module, clsobj, modobj,
+                                  missing)
+        if missing:
+            log.error('module has missing attributes: %s', str(missing))
+            return None
 
-            # skip modules that require network if it's not active
-            if not self._has_network() and modobj.needsNetwork():
-                log.error('module requires active network connection')
-                continue
+        # skip modules that should only appear in reconfig mode
+        if not reconfig and modobj.reconfig:
+            log.info('module only available in reconfig mode')
+            return None
 
-            # skip modules that should only appear in reconfig mode
-            if not reconfig and modobj.reconfig:
-                log.info('module only available in reconfig mode')
-                continue
+        # skip modules that require network if it's not active
+        if not self._has_network() and modobj.needsNetwork():
+            log.error('module requires active network connection')
+            self.offline.append(candidate)
+            return None
+
+        # skip hidden modules
+        with span('shouldAppear', 'loader', module=module):
+            hidden = not modobj.shouldAppear()
+        if hidden:
+            log.info('module is hidden')
+            return None
+
+        # skip empty module sets
+        if isinstance(modobj, ModuleSet):
+            modobj.loadModules(mode=reconfig)
+            if not modobj.moduleList:
+                log.error('module set is empty')
+                return None
 
-            # skip hidden modules
-            if not modobj.shouldAppear():
-                log.info('module is hidden')
+        lazy = LazyModule(module, entry, module=modobj)
+        lazy.adopt()
+        return lazy
+
+    def discover(self, module_dir, reconfig=False):
+        """Find the modules in module_dir and decide from the module index
+           which ones can be skipped or deferred, without importing any of
+           them.  load_modules does this itself if it hasn't been done, but
+           it can be called early since it needs neither a display nor gtk.
+        """
+        with _import_lock:
+            if not module_dir in sys.path:
+                sys.path.append(module_dir)
+
+        # sorted, so that modules with the same priority always come out in
+        # the same order
+        modules = sorted(os.path.splitext(f)[0] for f in os.listdir(module_dir)
+                         if f.endswith('.py'))
+
+        slots = []
+        candidates = []
+        for module in modules:
+            filename = os.path.join(os.path.abspath(module_dir),
+                                    module + '.py')
+            try:
+                st = os.stat(filename)
+            except OSError as e:
+                log.error('module could not be read: %s', e)
                 continue
 
-            # skip empty module sets
-            if isinstance(modobj, ModuleSet):
-                modobj.loadModules(mode=reconfig)
-                if not modobj.moduleList:
-                    log.error('module set is empty')
+            candidate = (module, filename, st, reconfig)
+            entry = self.index.lookup(filename, st)
+            if entry is not None:
+                if self._skip_indexed(entry, candidate):
+                    log.info('skipping module %s', module)
                     continue
 
+                # nothing left to decide at runtime, so the module does not
+                # need to be imported until its page is about to be shown
+                if entry['type'] == TYPE_MODULE and not entry['dynamic']:
+                    log.info('deferring module %s', module)
+                    factory = functools.partial(self._instantiate, module)
+                    slots.append(LazyModule(module, entry, factory=factory))
+                    continue
+
+            # filled in once the module has been probed
+            slots.append(len(candidates))
+            candidates.append(candidate)
+
+        self._discovered[(module_dir, reconfig)] = (slots, candidates)
+
+    def load_modules(self, module_dir, reconfig=False):
+        with span('load_modules', 'loader', path=module_dir):
+            return self._load_modules(module_dir, reconfig)
+
+    def _load_modules(self, module_dir, reconfig):
+        if (module_dir, reconfig) not in self._discovered:
+            self.discover(module_dir, reconfig)
+
+        slots, candidates = self._discovered.pop((module_dir, reconfig))
+        probed = parallel_map(self._probe, candidates, self.workers)
+
+        for slot in slots:
+            if isinstance(slot, int):
+                slot = probed[slot]
+
             # add the module to the list
-            self.modlist.append(modobj)
+            if slot is not None:
+                self.modlist.append(slot)
+
+        self.index.save()
 
         # sort modules
         self.modlist.sort(key=operator.attrgetter('priority'))
 
         return self.modlist
+
+    def load_offline(self):
+        """Probe the modules skipped for lack of network again.  Returns
+           the ones that are to be shown now, sorted by priority.  Only
+           modules loaded by this loader are considered, not the contents
+           of module sets it loaded.
+        """
+        if not self.offline or not self._has_network():
+            return []
+
+        candidates = sorted(self.offline)
+        self.offline = []
+
+        modules = [m for m in parallel_map(self._probe, candidates,
+                                           self.workers)
+                   if m is not None]
+        self.index.save()
+
+        modules.sort(key=operator.attrgetter('priority'))
+        self.modlist.extend(modules)
+        self.modlist.sort(key=operator.attrgetter('priority'))
+
+        return modules
@@ -0,0 +1,290 @@
+#
+# logconf.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""The logging setup of firstboot.
+
+   Loggers only put their records on a queue; a background thread takes
+   them off and writes them to stderr and, if asked to, to a log file
+   rotated by size, as plain text or as one JSON object per line.  A slow
+   console or disk then never holds up the thread that logged, which is
+   usually the one running the gtk main loop.  Should the writer fall that
+   far behind, records are dropped and how many is logged once it catches
+   up.
+
+   This module doesn't use gtk, but the writer thread only gets to run
+   while the gtk main loop waits if gobject.threads_init() was called
+   before the loop started.  progs/firstboot does so on its graphical
+   path.
+
+   The level can be set for each subsystem, the part of the logger name
+   after "firstboot.", e.g. "loader=debug,pwcheck=warning".
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import pkgutil
+import Queue
+import sys
+import threading
+
+from .constants import *
+
+
+log = logging.getLogger('firstboot.logconf')
+
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# the writer thread and its queue, while set up
+_listener = None
+
+
+class QueueHandler(logging.Handler):
+    """Puts records on queue for a QueueListener to handle, without waiting
+       for it.  Records that don't fit are counted in dropped.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The message and traceback are made into text here, as the
+        # arguments may have changed by the time the writer gets to them.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener:
+    """Takes records off queue on a daemon thread and passes them to
+       handlers.
+    """
+
+    def __init__(self, queue, handlers, source=None):
+        self.queue = queue
+        self.handlers = handlers
+        # the QueueHandler whose dropped records are reported
+        self.source = source
+        self._thread = None
+        self._reported = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='firstboot-log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Write the records still queued and stop the thread."""
+        if self._thread is None:
+            return
+
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+        for handler in self.handlers:
+            handler.close()
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _reportDropped(self):
+        dropped = self.source.dropped
+        if dropped == self._reported:
+            return
+
+        record = log.makeRecord(log.name, logging.WARNING, __file__, 0,
+                                "%d log records were dropped",
+                                (dropped - self._reported,), None)
+        self._reported = dropped
+        self.handle(record)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if self.source is not None:
+                self._reportDropped()
+
+            if record is None:
+                break
+
+            self.handle(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a JSON object on a single line."""
+
+    def format(self, record):
+        data = {'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'thread': record.threadName,
+                'message': record.getMessage()}
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+
+        return json.dumps(data, sort_keys=True)
+
+
+def parse_level(name):
+    """Return the logging level called name, e.g. "debug", or raise
+       ValueError.
+    """
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError("unknown log level %s" % name)
+
+    return level
+
+
+def subsystems():
+    """Return the names of the subsystems, the modules of firstboot, each
+       logging as "firstboot.<name>".
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    return set(name for (_loader, name, _ispkg)
+               in pkgutil.iter_modules([package]))
+
+
+def parse_levels(spec):
+    """Parse a level spec, a comma separated list of levels given either
+       as "level" for the default or as "subsystem=level", into (default
+       level or None, {logger name: level}).  Raises ValueError, also for
+       subsystems that don't exist.
+    """
+    default = None
+    levels = {}
+    known = None
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+
+        if '=' not in item:
+            default = parse_level(item)
+            continue
+
+        name, level = item.split('=', 1)
+        name = name.strip()
+        if name.startswith('firstboot.'):
+            name = name[len('firstboot.'):]
+
+        if name != 'firstboot':
+            if known is None:
+                known = subsystems()
+            if name not in known:
+                raise ValueError("unknown subsystem %s, expected one of %s"
+                                 % (name, ', '.join(sorted(known))))
+            name = 'firstboot.' + name
+
+        levels[name] = parse_level(level)
+
+    return default, levels
+
+
+def setup(level=logging.INFO, levels=None, path=None, use_json=False,
+          console=True, max_size=LOG_SIZE, backups=LOG_BACKUPS,
+          queue_size=LOG_QUEUE_SIZE):
+    """Set up logging for firstboot, replacing any earlier setup.
+
+       level      -- The level of loggers not given in levels.
+       levels     -- A dict of logger names and their levels.
+       path       -- The log file, or None to only log to stderr.
+       use_json   -- Whether the log file has JSON lines rather than text.
+       console    -- Whether to log to stderr.
+       max_size   -- Bytes the log file is rotated at.
+       backups    -- How many rotated log files are kept.
+       queue_size -- How many records can wait to be written before
+                     more are dropped.
+    """
+    global _listener
+
+    shutdown()
+
+    handlers = []
+    if console:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(FORMAT))
+        handlers.append(handler)
+
+    if path is not None:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_size, backupCount=backups)
+        handler.setFormatter(JsonFormatter() if use_json
+                             else logging.Formatter(FORMAT))
+        handlers.append(handler)
+
+    queue = Queue.Queue(queue_size)
+    handler = QueueHandler(queue)
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    for name, subsystemLevel in (levels or {}).items():
+        logging.getLogger(name).setLevel(subsystemLevel)
+
+    _listener = QueueListener(queue, handlers, handler)
+    _listener.start()
+
+
+def shutdown():
+    """Write out the records still queued and stop the writer thread."""
+    global _listener
+
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler) and \
+           handler.queue is listener.queue:
+            root.removeHandler(handler)
+
+    listener.stop()
+
+
+atexit.register(shutdown)
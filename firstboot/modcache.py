@@ -0,0 +1,187 @@
+#
+# modcache.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+import tempfile
+import threading
+
+from .constants import *
+from .module import Module
+from .moduleset import ModuleSet
+
+
+import logging
+log = logging.getLogger('firstboot.modcache')
+
+
+# bump this whenever the layout of the index entries changes
+INDEX_VERSION = 1
+
+TYPE_MODULE = 'module'
+TYPE_SET = 'set'
+
+
+def _encode(obj):
+    # json hands back unicode, the rest of firstboot works with utf-8 str
+    if isinstance(obj, dict):
+        return dict((_encode(k), _encode(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [_encode(item) for item in obj]
+    elif isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    else:
+        return obj
+
+
+def _overrides(clsobj, base, name):
+    # unbound methods in python 2, plain functions later on
+    method = getattr(clsobj, name, None)
+    default = getattr(base, name)
+    return (getattr(method, '__func__', method) is not
+            getattr(default, '__func__', default))
+
+
+class ModuleIndex:
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+
+        # the loader may update the index from several threads
+        self._lock = threading.Lock()
+
+        # module titles are translated when the module is instantiated, so
+        # an index built under a different language is worthless
+        self.lang = os.environ.get('LANG')
+
+        if self.path is not None:
+            self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as fobj:
+                data = _encode(json.load(fobj))
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            log.warning('module index %s is corrupted: %s', self.path, e)
+            return
+
+        if data.get('version') != INDEX_VERSION:
+            log.info('module index has a different version, rebuilding')
+            return
+
+        if data.get('lang') != self.lang:
+            log.info('module index was built for a different language, '
+                     'rebuilding')
+            return
+
+        self.entries = data.get('modules', {})
+
+    def lookup(self, filename, st):
+        """Return the cached metadata for filename, or None if the file
+           is not indexed or changed since it was indexed.
+        """
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+
+        if entry['mtime'] != st.st_mtime or entry['size'] != st.st_size:
+            log.debug('module index entry for %s is stale', filename)
+            return None
+
+        return entry
+
+    def update(self, filename, st, name, clsobj, modobj, missing):
+        """Record the metadata of a freshly instantiated module."""
+        if isinstance(modobj, ModuleSet):
+            modtype, base = TYPE_SET, ModuleSet
+        else:
+            modtype, base = TYPE_MODULE, Module
+
+        # modules that override these decide at runtime, so the cached
+        # answer can't be trusted
+        dynamic = (_overrides(clsobj, base, 'shouldAppear') or
+                   _overrides(clsobj, base, 'needsNetwork'))
+
+        entry = {'mtime': st.st_mtime,
+                 'size': st.st_size,
+                 'name': name,
+                 'type': modtype,
+                 'dynamic': dynamic,
+                 'missing': missing,
+                 'mode': getattr(modobj, 'mode', None),
+                 'priority': getattr(modobj, 'priority', None),
+                 'sidebarTitle': getattr(modobj, 'sidebarTitle', None),
+                 'title': getattr(modobj, 'title', None),
+                 'path': getattr(modobj, 'path', None),
+                 'needsNetwork': None}
+
+        if not missing and not dynamic:
+            entry['needsNetwork'] = bool(modobj.needsNetwork())
+
+        with self._lock:
+            if self.entries.get(filename) != entry:
+                self.entries[filename] = entry
+                self.dirty = True
+
+        return entry
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        data = {'version': INDEX_VERSION,
+                'lang': self.lang,
+                'modules': self.entries}
+
+        dirname = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            fd, tmp = tempfile.mkstemp(prefix='.modules-', dir=dirname)
+            with os.fdopen(fd, 'w') as fobj:
+                json.dump(data, fobj)
+
+            os.rename(tmp, self.path)
+        except (IOError, OSError, ValueError) as e:
+            log.warning('could not write the module index %s: %s',
+                        self.path, e)
+            return
+
+        self.dirty = False
+
+
+_indexes = {}
+
+def get_index(path):
+    """Return the index stored at path, shared by every loader in this
+       process.  A path of None gives an index that is never persisted.
+    """
+    if path not in _indexes:
+        _indexes[path] = ModuleIndex(path)
+
+    return _indexes[path]
@@ -20,6 +20,7 @@
 from firstboot.config import *
 from firstboot.constants import *
 import logging
+log = logging.getLogger('firstboot.module')
 
 import gettext
 _ = lambda x: gettext.ldgettext("firstboot", x)
@@ -39,6 +40,11 @@ class Module:
            is not required.  The module loader will check that all required
            attributes are present and defined.  Instance attributes;
 
+           asyncApply   -- When firstboot runs with --async-apply, apply is
+                           called in a thread of its own unless this is
+                           False.  Modules whose apply uses gtk, or is
+                           otherwise not safe to call outside of the main
+                           thread, should set it to False.
            icon         -- No longer used.
            mode         -- The mode of firstboot operation that this module
                            should appear in.  MODE_REGULAR means the module
@@ -67,6 +73,7 @@ class Module:
         if self.__class__ is Module:
             raise TypeError, "Module is an abstract class."
 
+        self.asyncApply = True
         self.icon = None
         self.mode = MODE_REGULAR
         self.priority = 0
@@ -102,6 +109,22 @@ class Module:
         """
         raise NotImplementedError, "apply() not implemented for Module."
 
+    def applyHeadless(self, answers, testing=False):
+        """Called instead of apply when firstboot runs without a display,
+           from an answer file.  This method takes the action apply would
+           have, based on the given answers instead of the state of the UI,
+           and returns RESULT_SUCCESS or RESULT_FAILURE.  It must not use gtk.
+           By default, NotImplementedError is raised and the module is
+           skipped.  Modules that can be run unattended should override this
+           method.  Arguments:
+
+           answers -- A dict of the values in the module's section of the
+                      answer file, as strings.  Empty if there is none.
+           testing -- If True, this method must not make any permanent
+                      changes to disk.
+        """
+        raise NotImplementedError, "applyHeadless() not implemented for Module."
+
     def createScreen(self):
         """Create a new instance of gtk.VBox, the UI elements required for
            this module, and pack them into self.vbox.  Do not take any action
@@ -147,6 +170,17 @@ class Module:
         """
         return False
 
+    def prefetch(self):
+        """Do whatever slow work initializeUI() will need ahead of time,
+           such as reading large files or enumerating devices.  This method
+           is called from an idle callback while an earlier page is being
+           displayed, after createScreen() and renderModule() but before
+           initializeUI().  It may be called again every time the module is
+           about to be displayed.  By default, nothing is done.  Modules with
+           a slow initializeUI() should override this method.
+        """
+        pass
+
     def renderModule(self, interface):
         """Wrap the module's top-level UI element in the other elements
            required to make sure all modules have the same common look.  This
@@ -157,7 +191,7 @@ class Module:
            interface -- A reference to the running Interface class.
         """
         if self.vbox is None:
-            logging.error("Module %s has not initialized its UI" % self.title)
+            log.error("Module %s has not initialized its UI" % self.title)
             raise SystemError, "Module %s has not initializes its UI" % self.title
 
         import gtk
@@ -176,6 +210,19 @@ class Module:
         self.vbox.pack_start(titleBox, False)
         self.vbox.reorder_child(titleBox, 0)
 
+    def renderText(self, interface):
+        """Show the module on a terminal, when firstboot runs in text mode,
+           and take the action apply would have.  The module's questions are
+           asked with interface.prompt(), interface.confirm() and
+           interface.choose(), and anything else is shown with
+           interface.write().  This method returns one of the RESULT_*
+           values, just like apply.  Modules that don't override it are not
+           shown in text mode.  Arguments:
+
+           interface -- A reference to the running TextInterface class.
+        """
+        raise NotImplementedError, "renderText() not implemented for Module."
+
     def shouldAppear(self):
         """Should this module appear in firstboot?  This method will be called
            after the module is loaded, but before any UI work is performed.
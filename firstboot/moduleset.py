@@ -20,6 +20,7 @@
 from firstboot.constants import *
 from firstboot.module import *
 import logging
+log = logging.getLogger('firstboot.moduleset')
 
 import gettext
 _ = lambda x: gettext.ldgettext("firstboot", x)
@@ -85,11 +86,13 @@ class ModuleSet:
            contained within this set.  Subclasses should not need to override
            this method.
         """
+        from firstboot.lazy import is_module_set
+
         for module in self.moduleList:
             module.createScreen()
 
-            if isinstance(module, Module) and module.vbox is None:
-                logging.error(_("Module %s did not set up its UI; removing.") % module.title)
+            if not is_module_set(module) and module.vbox is None:
+                log.error(_("Module %s did not set up its UI; removing.") % module.title)
                 self.moduleList.remove(module)
 
     def initializeUI(self):
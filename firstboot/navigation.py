@@ -0,0 +1,382 @@
+#
+# navigation.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+
+from .lazy import is_module_set
+
+
+class TitleIndex:
+    """Where each module title is found in a module list and in the module
+       sets it contains, looked up without walking the lists.
+
+       A page is located by its set path, the page numbers of the sets
+       containing it from the top level down (empty for the top level), and
+       its page number in the innermost set.  When a title is used more
+       than once, the first page in the order pages are shown is found.
+
+       The index is a snapshot: it has to be built again when pages are
+       added or removed.
+    """
+
+    def __init__(self, moduleList):
+        # id of a module list -> (the list, {title: page number})
+        self._lists = {}
+        # title -> (set path, page number)
+        self._locations = {}
+
+        self._add(moduleList, ())
+
+    def _add(self, moduleList, path):
+        pages = {}
+        # the list is kept so that its id isn't reused while indexed
+        self._lists[id(moduleList)] = (moduleList, pages)
+
+        for pageNum, module in enumerate(moduleList):
+            title = module.title
+            if title is not None:
+                pages.setdefault(title, pageNum)
+                self._locations.setdefault(title, (path, pageNum))
+
+            if is_module_set(module):
+                self._add(module.moduleList, path + (pageNum,))
+
+    def knows(self, moduleList):
+        """Is moduleList one of the lists indexed?"""
+        return id(moduleList) in self._lists
+
+    def page(self, title, moduleList):
+        """Return the page number of title in moduleList, which must be
+           one of the lists indexed, or None if it isn't there.
+        """
+        return self._lists[id(moduleList)][1].get(title)
+
+    def locate(self, title):
+        """Return (set path, page number) of title, or None."""
+        return self._locations.get(title)
+
+
+class History(object):
+    """The pages of one module list visited before the current one, most
+       recent last, kept in an array with a count of each page so that
+       membership tests don't scan it.
+    """
+
+    def __init__(self, pages=()):
+        self._pages = array.array('i')
+        self._counts = {}
+        for page in pages:
+            self.append(page)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def __contains__(self, page):
+        return page in self._counts
+
+    def __repr__(self):
+        return 'History(%r)' % list(self._pages)
+
+    def append(self, page):
+        self._pages.append(page)
+        self._counts[page] = self._counts.get(page, 0) + 1
+
+    def pop(self):
+        page = self._pages.pop()
+        if self._counts[page] == 1:
+            del self._counts[page]
+        else:
+            self._counts[page] -= 1
+
+        return page
+
+    def _renumber(self, pages):
+        self._pages = array.array('i')
+        self._counts = {}
+        for page in pages:
+            self.append(page)
+
+    def pageRemoved(self, pageNum):
+        """Forget pageNum, moving the pages after it one down."""
+        self._renumber(p if p < pageNum else p - 1
+                       for p in self._pages if p != pageNum)
+
+    def pageInserted(self, pageNum):
+        """Move the pages from pageNum on one up."""
+        self._renumber(p if p < pageNum else p + 1 for p in self._pages)
+
+
+class Control:
+    """The navigation state of one level of the module tree: the top-level
+       module list, or the module list of a ModuleSet that was entered.
+    """
+
+    def __init__(self, moduleList=None, history=None):
+        self.currentPage = 0
+        self.history = history if history is not None else History()
+        self.moduleList = moduleList if moduleList is not None else []
+
+
+class PageTable:
+    """The pages of the module tree in the order they are shown, the
+       contents of each ModuleSet taking its place, so that the pages after
+       any page are found without walking the tree.  Only used to look
+       ahead; moving between pages goes through the Navigator's stack.
+    """
+
+    def __init__(self, moduleList):
+        self.pages = []
+        # id of a page -> its index in pages
+        self._positions = {}
+
+        self._add(moduleList)
+
+    def _add(self, moduleList):
+        for module in moduleList:
+            if is_module_set(module):
+                self._add(module.moduleList)
+                continue
+
+            self._positions[id(module)] = len(self.pages)
+            self.pages.append(module)
+
+    def leavesAfter(self, module, count):
+        """Return up to count pages shown after module, in order."""
+        index = self._positions[id(module)] + 1
+        return self.pages[index:index + count]
+
+
+class Navigator:
+    """Where the user is in the module tree and how they got there, shared
+       by the interfaces.  There is a Control on the stack for the top level
+       and for each ModuleSet entered.  Moving around is a loop over that
+       stack rather than recursion, and only ever touches the levels being
+       left or entered.  Each level's History answers membership tests
+       without scanning.
+
+       realize is called with each page about to become the current one and
+       returns whether it can be shown; pages it fails for are removed and
+       the next page takes their place.  removed is called with the level
+       (0 for the top level) and page number of every page removed.
+    """
+
+    def __init__(self, moduleList=(), realize=None, removed=None):
+        self._realize = realize
+        self._removed = removed
+        self.setModuleList(list(moduleList))
+
+    def setModuleList(self, moduleList):
+        self.stack = [Control(moduleList)]
+        self.control = self.stack[0]
+
+        # id of a ModuleSet -> (the set, the history of its level when it
+        # was last left by moving forward)
+        self._saved = {}
+        self._table = None
+
+    @property
+    def table(self):
+        # Built when first needed, and again after pages come or go.
+        if self._table is None:
+            self._table = PageTable(self.stack[0].moduleList)
+
+        return self._table
+
+    @property
+    def moduleList(self):
+        return self.control.moduleList
+
+    @property
+    def topPage(self):
+        return self.stack[0].currentPage
+
+    @property
+    def current(self):
+        """The page being shown, or None past the end."""
+        control = self.control
+        if control.currentPage < len(control.moduleList):
+            return control.moduleList[control.currentPage]
+
+        return None
+
+    def canGoBack(self):
+        for control in self.stack:
+            if control.history:
+                return True
+
+        return False
+
+    def _push(self, module):
+        # The saved history is used as it is, so going back and forth in
+        # the set changes what is found the next time it is entered.
+        saved = self._saved.get(id(module))
+        history = saved[1] if saved is not None else None
+
+        self.control = Control(module.moduleList, history)
+        self.stack.append(self.control)
+
+    def _pop(self):
+        old = self.stack.pop()
+        self.control = self.stack[-1]
+        return old
+
+    def remove(self, pageNum):
+        """Remove page pageNum from the current level, keeping the rest of
+           the navigation state pointing at the same pages.
+        """
+        control = self.control
+        module = control.moduleList.pop(pageNum)
+        self._saved.pop(id(module), None)
+        self._table = None
+
+        control.history.pageRemoved(pageNum)
+        if control.currentPage > pageNum:
+            control.currentPage -= 1
+
+        if self._removed is not None:
+            self._removed(len(self.stack) - 1, pageNum)
+
+    def insert(self, pageNum, module):
+        """Insert module at the top level as page pageNum, which has to come
+           after the current top-level page.
+        """
+        top = self.stack[0]
+        top.moduleList.insert(pageNum, module)
+        self._table = None
+
+        top.history.pageInserted(pageNum)
+
+    def moveTo(self, pageNum):
+        """Move to page pageNum of the current level.  Moving to the page
+           after the last one leaves a ModuleSet, and moving to a ModuleSet
+           enters it, at the page it was left at if it was left forward.
+           Returns the page to show, or None when moving past the last
+           top-level page.
+        """
+        while True:
+            control = self.control
+
+            if pageNum == len(control.moduleList):
+                if len(self.stack) == 1:
+                    control.currentPage += 1
+                    return None
+
+                old = self._pop()
+                control = self.control
+
+                # Every module in the set failed to load, so the set goes
+                # away too.
+                if not old.moduleList:
+                    self.remove(control.currentPage)
+                    pageNum = control.currentPage
+                    continue
+
+                # Keep the set's history, with its last page, should we go
+                # back into the set later on.
+                old.history.append(old.currentPage)
+                module = control.moduleList[control.currentPage]
+                self._saved[id(module)] = (module, old.history)
+
+                pageNum = control.currentPage + 1
+                continue
+
+            module = control.moduleList[pageNum]
+            isSet = is_module_set(module)
+
+            # Pages that can't be shown are dropped, the next page taking
+            # their place.
+            if not isSet and self._realize is not None and \
+               not self._realize(module):
+                self.remove(pageNum)
+                continue
+
+            # Only add the current page to the history if we are moving
+            # forward.  Adding it when we're going backwards traps us at the
+            # first page of a ModuleSet.
+            if pageNum > control.currentPage and \
+               control.currentPage not in control.history:
+                control.history.append(control.currentPage)
+
+            control.currentPage = pageNum
+
+            if not isSet:
+                return module
+
+            self._push(module)
+            pageNum = self.control.history.pop() if self.control.history \
+                      else 0
+
+    def back(self):
+        """Move to the page shown before the current one, leaving ModuleSets
+           as needed.  Returns the page to show, or None if there is no page
+           to go back to.
+        """
+        if not self.canGoBack():
+            return None
+
+        while not self.control.history:
+            self._pop()
+
+        control = self.control
+        control.currentPage = control.history.pop()
+        return self.moveTo(control.currentPage)
+
+    def next(self):
+        return self.moveTo(self.control.currentPage + 1)
+
+    def jump(self, setPath, pageNum):
+        """Move to page pageNum of the ModuleSet at setPath, given as the
+           page numbers of the ModuleSets containing it from the top level
+           down, leaving and entering ModuleSets as needed.  Returns the page
+           to show, like moveTo.
+        """
+        # Leave the ModuleSets the page is not in...
+        common = 0
+        while common < min(len(self.stack) - 1, len(setPath)) and \
+              self.stack[common].currentPage == setPath[common]:
+            common += 1
+
+        while len(self.stack) > common + 1:
+            self._pop()
+
+        # ...and enter the ones it is in, as moveTo does, so that going back
+        # from the page takes the same path however it was reached.
+        for setPage in setPath[common:]:
+            control = self.control
+            if setPage > control.currentPage and \
+               control.currentPage not in control.history:
+                control.history.append(control.currentPage)
+            control.currentPage = setPage
+
+            self._push(control.moduleList[setPage])
+            if self.control.history:
+                self.control.currentPage = self.control.history.pop()
+
+        return self.moveTo(pageNum)
+
+    def upcoming(self, count):
+        """Return the next count pages moving forward would show."""
+        module = self.current
+        if module is None or count <= 0:
+            return []
+
+        return self.table.leavesAfter(module, count)
@@ -0,0 +1,144 @@
+#
+# network.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import errno
+import socket
+import threading
+
+
+import logging
+log = logging.getLogger('firstboot.network')
+
+
+# from linux/netlink.h and linux/rtnetlink.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+
+# how often to look at the links when netlink is not available, in seconds
+POLL_INTERVAL = 5
+
+
+def active_devices():
+    import ethtool
+    return [i for i in ethtool.get_active_devices() if i != 'lo']
+
+
+class NetworkState:
+    """The state of the network links, probed once and then kept up to date
+       from link change notifications for as long as anybody listens.
+
+       Link changes are watched through a netlink socket hooked into the
+       gobject main loop, or by polling every POLL_INTERVAL seconds if
+       netlink is not available.  Callbacks are called from the main loop
+       with a single argument telling whether the network is up.
+    """
+
+    def __init__(self, probe=active_devices):
+        self._probe = probe
+        self._devices = None
+        self._lock = threading.Lock()
+
+        self._callbacks = []
+        self._sock = None
+        self._source = None
+
+    def has_network(self):
+        with self._lock:
+            if self._devices is None:
+                self._devices = self._probe()
+
+            return bool(self._devices)
+
+    def refresh(self):
+        """Probe the links again, calling the callbacks if they changed."""
+        devices = self._probe()
+        with self._lock:
+            changed = devices != self._devices
+            self._devices = devices
+
+        if changed:
+            log.info('network links changed: %s', ', '.join(devices) or 'none')
+            for callback in self._callbacks[:]:
+                callback(bool(devices))
+
+    def subscribe(self, callback):
+        self.has_network()
+        self._callbacks.append(callback)
+        if self._source is None:
+            self._watch()
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+        if not self._callbacks:
+            self._unwatch()
+
+    def _watch(self):
+        import gobject
+
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                       NETLINK_ROUTE)
+            self._sock.bind((0, RTMGRP_LINK))
+            self._sock.setblocking(False)
+        except (AttributeError, socket.error) as e:
+            log.info('netlink is not available (%s), polling for link '
+                     'changes', e)
+            self._sock = None
+            self._source = gobject.timeout_add_seconds(POLL_INTERVAL,
+                                                       self._poll)
+            return
+
+        self._source = gobject.io_add_watch(self._sock.fileno(),
+                                            gobject.IO_IN, self._readable)
+
+    def _unwatch(self):
+        import gobject
+
+        if self._source is not None:
+            gobject.source_remove(self._source)
+            self._source = None
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _poll(self):
+        self.refresh()
+        return True
+
+    def _readable(self, fd, condition):
+        # the messages themselves don't matter, only that something changed
+        while True:
+            try:
+                self._sock.recv(65536)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # most likely ENOBUFS, we missed some messages
+                    log.debug('netlink read failed: %s', e)
+                break
+
+        self.refresh()
+        return True
+
+
+_state = NetworkState()
+
+def get_state():
+    """Return the NetworkState shared by the whole process."""
+    return _state
@@ -0,0 +1,266 @@
+#
+# profiling.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Profiling of the calls the interface makes into modules.
+
+   Once enable() is called, every call wrapped in profile() is run under
+   cProfile, and under tracemalloc when it is available, and the results
+   are saved to the profile directory as
+
+     <module>/<n>-<call>.prof        pstats data, see python -m pstats
+     <module>/<n>-<call>.alloc.txt   memory allocated by the call, by line
+
+   where <module> is the qualified name of the module, so modules in a set
+   are found in the set's directory.  A summary of the hotspots of each
+   module is printed at exit.
+"""
+
+import atexit
+import collections
+import cProfile
+import itertools
+import os
+import pstats
+import sys
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+import logging
+log = logging.getLogger('firstboot.profiling')
+
+
+# how many frames of each allocation to keep, and how many lines to report
+FRAMES = 1
+TOP = 5
+
+_dir = None
+_counter = itertools.count(1)
+_local = threading.local()
+
+# qualified module name -> _Results
+_results = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+class _Results:
+
+    def __init__(self):
+        self.calls = []
+        self.stats = None
+        self.allocations = collections.defaultdict(int)
+
+
+class _NullProfile(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_profile = _NullProfile()
+
+
+class _Profile(object):
+
+    def __init__(self, name, call):
+        self.name = name
+        self.call = call
+
+        self.profiler = None
+        self.snapshot = None
+
+    def __enter__(self):
+        _local.active = True
+
+        if tracemalloc is not None:
+            self.snapshot = tracemalloc.take_snapshot()
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        _local.active = False
+
+        try:
+            self._save()
+        except (IOError, OSError) as e:
+            log.error('could not save the profile of %s.%s: %s',
+                      self.name, self.call, e)
+
+        return False
+
+    def _allocations(self):
+        if self.snapshot is None:
+            return []
+
+        # leave out what profiling itself allocated
+        ignore = [tracemalloc.Filter(False,
+                                     os.path.splitext(m.__file__)[0] + '.py*')
+                  for m in (tracemalloc, cProfile, sys.modules[__name__])]
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        before = self.snapshot.filter_traces(ignore)
+
+        return [diff for diff in after.compare_to(before, 'lineno')
+                if diff.size_diff > 0]
+
+    def _save(self):
+        directory = os.path.join(_dir, self.name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        base = os.path.join(directory, '%d-%s' % (next(_counter), self.call))
+        self.profiler.dump_stats(base + '.prof')
+
+        allocations = self._allocations()
+        if allocations:
+            with open(base + '.alloc.txt', 'w') as fobj:
+                for diff in allocations:
+                    fobj.write('%s\n' % diff)
+
+        # None when memory wasn't traced, rather than nothing allocated
+        allocated = None
+        if self.snapshot is not None:
+            allocated = sum(d.size_diff for d in allocations)
+
+        stats = pstats.Stats(self.profiler)
+        with _lock:
+            results = _results.setdefault(self.name, _Results())
+            results.calls.append((self.call, stats.total_tt, allocated))
+
+            if results.stats is None:
+                results.stats = stats
+            else:
+                results.stats.add(stats)
+
+            for diff in allocations:
+                frame = diff.traceback[0]
+                results.allocations['%s:%d' % (frame.filename,
+                                               frame.lineno)] += diff.size_diff
+
+
+def enabled():
+    return _dir is not None
+
+
+def enable(directory):
+    """Start profiling the module calls, saving the results to directory."""
+    global _dir
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    if tracemalloc is None:
+        log.warning('tracemalloc is not available, not profiling memory')
+    elif not tracemalloc.is_tracing():
+        tracemalloc.start(FRAMES)
+
+    if _dir is None:
+        atexit.register(print_summary)
+    _dir = directory
+
+
+def profile(module, call):
+    """Return a context manager profiling the call of module's method call
+       in its block.  Calls made while profiling, from the same thread, are
+       part of the outer profile.
+    """
+    if _dir is None or getattr(_local, 'active', False):
+        return _null_profile
+
+    name = getattr(module, 'qualifiedName', None) or \
+        module.__class__.__module__
+    return _Profile(name, call)
+
+
+def _function(func):
+    filename, lineno, name = func
+    if filename == '~':
+        # built-in functions
+        return name
+
+    return '%s:%d(%s)' % (filename, lineno, name)
+
+
+def _kib(size):
+    if size is None:
+        return 'n/a'
+
+    return '%.1f' % (size / 1024.0)
+
+
+def print_summary(out=None):
+    """Print the calls made to each module and their hotspots."""
+    if out is None:
+        out = sys.stderr
+
+    with _lock:
+        results = list(_results.items())
+
+    if not results:
+        return
+
+    out.write('\nModule profiles saved to %s\n\n' % _dir)
+    out.write('%-40s %-14s %10s %14s\n' % ('module', 'call', 'cpu (s)',
+                                           'alloc (KiB)'))
+
+    # the modules of a set are attributed to it as well
+    totals = collections.OrderedDict()
+    for name, result in results:
+        top = name.split('/')[0]
+        cpu, alloc = totals.get(top, (0.0, 0))
+        for call, call_cpu, call_alloc in result.calls:
+            out.write('%-40s %-14s %10.3f %14s\n' % (name, call, call_cpu,
+                                                     _kib(call_alloc)))
+            cpu += call_cpu
+            if alloc is not None and call_alloc is not None:
+                alloc += call_alloc
+            else:
+                alloc = None
+        totals[top] = (cpu, alloc)
+
+    out.write('\n%-40s %-14s %10s %14s\n' % ('module or set', '', 'cpu (s)',
+                                             'alloc (KiB)'))
+    for top, (cpu, alloc) in totals.items():
+        out.write('%-40s %-14s %10.3f %14s\n' % (top, 'total', cpu,
+                                                 _kib(alloc)))
+
+    for name, result in results:
+        out.write('\nTop CPU hotspots of %s:\n' % name)
+        funcs = sorted(result.stats.stats.items(), key=lambda i: i[1][2],
+                       reverse=True)
+        for func, (cc, nc, tt, ct, callers) in funcs[:TOP]:
+            out.write('  %10.3fs %8d calls  %s\n' % (tt, nc, _function(func)))
+
+        if result.allocations:
+            out.write('Top allocations of %s:\n' % name)
+            lines = sorted(result.allocations.items(), key=lambda i: i[1],
+                           reverse=True)
+            for line, size in lines[:TOP]:
+                out.write('  %10.1f KiB  %s\n' % (size / 1024.0, line))
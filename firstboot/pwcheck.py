@@ -19,67 +19,134 @@
 # Red Hat Author(s):  Martin Gracik <mgracik@redhat.com>
 #
 
+import Queue
 import re
-import pwquality
+import threading
+import time
 
 import pygtk
 pygtk.require("2.0")
+import cairo
+import gobject
 import gtk
 
 import logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("pwcheck")
+log = logging.getLogger('firstboot.pwcheck')
 
 import gettext
 _ = lambda x: gettext.ldgettext("firstboot", x)
 
+# The policy itself lives in pwpolicy, which doesn't need gtk.
+from firstboot.pwpolicy import PWQUALITY_CONF, Password, clamp, get_settings
 
-def clamp(value, lowerbound, upperbound):
-    return min(max(value, lowerbound), upperbound)
 
+# milliseconds to wait for more typing before checking a password
+CHECK_DELAY = 200
 
-class Password(object):
+# milliseconds between redraws of the strength meter, about 60 per second,
+# and seconds an animated meter takes to reach a new strength
+FRAME_INTERVAL = 16
+ANIMATION_TIME = 0.15
 
-    MIN_STRENGTH = 0
-    MAX_STRENGTH = 100
 
-    STRENGTH_STRINGS = [ _("Very weak"),
-                         _("Weak"),
-                         _("Fairly strong"),
-                         _("Strong"),
-                         _("Very strong") ]
+class PasswordChecker(object):
+    """Checks passwords as they are typed without blocking the UI.
 
-    def __init__(self, password, username=None):
-        self.password = password
-        self.username = username
-        self.pwq_settings = pwquality.PWQSettings()
-        self.pwq_settings.read_config()
+       A check is only started once no new password was given for delay
+       milliseconds, and runs in a thread of its own.  callback is then
+       called from the main loop with the resulting Password, unless another
+       password was given in the meantime.
 
-        self.strength = self.MIN_STRENGTH
-        self.pwq_msg = ''
-        try:
-            self.strength = self.pwq_settings.check(self.password, None, self.username)
-        except pwquality.PWQError as (e, msg):
-            self.pwq_msg = msg
+       The thread only gets to run while the main loop waits if
+       gobject.threads_init() was called before it started, as
+       progs/firstboot does.
+    """
 
-        self.strength = clamp(self.strength, self.MIN_STRENGTH, self.MAX_STRENGTH)
+    def __init__(self, callback, delay=CHECK_DELAY):
+        self.callback = callback
+        self.delay = delay
 
-    @property
-    def strength_frac(self):
-        return float(self.strength) / self.MAX_STRENGTH
+        self._source = None
+        self._pending = None
+        self._generation = 0
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._stopped = False
 
-    @property
-    def strength_string(self):
-        strings_count = len(self.STRENGTH_STRINGS)
-        index = int(self.strength / (self.MAX_STRENGTH / strings_count))
+    def check(self, password, username=None):
+        """Check password once typing stops.  Must be called from the main
+           loop.
+        """
+        if self._stopped:
+            return
+
+        self._generation += 1
+        self._pending = (self._generation, password, username)
+
+        if self._source is not None:
+            gobject.source_remove(self._source)
+        self._source = gobject.timeout_add(self.delay, self._start)
+
+    def cancel(self):
+        """Forget the password being checked, if any."""
+        self._generation += 1
+        self._pending = None
+
+        if self._source is not None:
+            gobject.source_remove(self._source)
+            self._source = None
+
+    def stop(self):
+        """Stop the thread, dropping any result still to come.  The checker
+           can't be used afterwards.
+        """
+        self.cancel()
+        self._stopped = True
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread = None
 
-        try:
-            return self.STRENGTH_STRINGS[index]
-        except IndexError:
-            return self.STRENGTH_STRINGS[-1]
+    def _start(self):
+        self._source = None
 
-    def __str__(self):
-        return "%s" % self.password
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="pwcheck")
+            self._thread.daemon = True
+            self._thread.start()
+
+        if self._pending is not None:
+            self._queue.put(self._pending)
+            self._pending = None
+
+        return False
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            # only the latest password is of any interest
+            while not self._queue.empty():
+                request = self._queue.get()
+
+            # stop() was called
+            if request is None:
+                break
+
+            generation, password, username = request
+            try:
+                result = Password(password, username)
+            except Exception as e:
+                log.error("checking the password failed: %s", e)
+                continue
+
+            gobject.idle_add(self._deliver, generation, result)
+
+    def _deliver(self, generation, result):
+        if not self._stopped and generation == self._generation:
+            self.callback(result)
+
+        return False
 
 
 class StrengthMeter(gtk.DrawingArea):
@@ -89,11 +156,25 @@ class StrengthMeter(gtk.DrawingArea):
               (141.0/255.0, 133.0/255.0, 241.0/255.0),
               (99.0/255.0, 251.0/255.0, 107.0/255.0)]
 
-    def __init__(self):
+    def __init__(self, animate=False):
         super(StrengthMeter, self).__init__()
         self.connect("expose_event", self.expose)
+        self.connect("destroy", self._destroyed)
 
+        # The fraction drawn and the one set, which differ while animating
+        # from one to the other.
+        self.animate = animate
         self._fraction = 0.0
+        self._target = 0.0
+        self._start = None
+
+        # Changes are drawn on the next frame, all at once.
+        self._frame_source = None
+
+        # The outline doesn't change with the fraction, so it's drawn once
+        # per size.
+        self._outline = None
+        self._outline_size = None
 
     def curved_rectangle(self, context, x0, y0, width, height, radius):
         if not width or not height:
@@ -151,52 +232,92 @@ class StrengthMeter(gtk.DrawingArea):
 
         return False
 
+    def _get_outline(self, context, width, height):
+        if self._outline_size != (width, height):
+            surface = context.get_target().create_similar(
+                cairo.CONTENT_COLOR_ALPHA, width, height)
+            outline = cairo.Context(surface)
+            outline.set_source_rgb(0.0, 0.0, 0.0)
+            outline.set_line_width(1)
+            self.curved_rectangle(outline, 0.5, 0.5, width - 1, height - 1, 4)
+            outline.stroke()
+
+            self._outline = surface
+            self._outline_size = (width, height)
+
+        return self._outline
+
     def draw(self, context):
         alloc = self.get_allocation()
         context.translate(-alloc.x, -alloc.y)
 
         context.save()
-        context.set_source_rgb(0.0, 0.0, 0.0)
-        context.set_line_width(1)
-        self.curved_rectangle(context, alloc.x + 0.5, alloc.y + 0.5,
-                              alloc.width - 1, alloc.height - 1,
-                              4)
-        context.stroke()
+        context.set_source_surface(self._get_outline(context, alloc.width,
+                                                     alloc.height),
+                                   alloc.x, alloc.y)
+        context.paint()
         context.restore()
 
         context.save()
         r, g, b = self.get_color()
         context.set_source_rgb(r, g, b)
         context.rectangle(alloc.x + 1, alloc.y + 1,
-                          self.fraction * (alloc.width - 2), alloc.height - 2)
+                          self._fraction * (alloc.width - 2), alloc.height - 2)
         context.fill_preserve()
         context.restore()
 
     def redraw(self):
+        # However often this is called, the meter is drawn at most once a
+        # frame, by gtk when it gets to it.
+        if self._frame_source is None:
+            self._frame_source = gobject.timeout_add(FRAME_INTERVAL,
+                                                     self._frame)
+
+    def _frame(self):
+        animating = False
+        if self._start is not None:
+            start_time, start_fraction = self._start
+            progress = min((time.time() - start_time) / ANIMATION_TIME, 1.0)
+            self._fraction = start_fraction + \
+                (self._target - start_fraction) * progress
+            if progress < 1.0:
+                animating = True
+            else:
+                self._start = None
+
         if self.window:
-            alloc = self.get_allocation()
+            self.queue_draw()
 
-            rect = gtk.gdk.Rectangle(0, 0, alloc.width, alloc.height)
-            self.window.invalidate_rect(rect, True)
+        if not animating:
+            self._frame_source = None
+        return animating
 
-            self.queue_draw_area(alloc.x, alloc.y, alloc.width, alloc.height)
-            self.window.process_updates(True)
+    def _destroyed(self, widget):
+        if self._frame_source is not None:
+            gobject.source_remove(self._frame_source)
+            self._frame_source = None
 
     @property
     def fraction(self):
-        return self._fraction
+        return self._target
 
     @fraction.setter
     def fraction(self, fraction):
-        self._fraction = fraction
+        self._target = fraction
+        if self.animate and self.window:
+            self._start = (time.time(), self._fraction)
+        else:
+            self._fraction = fraction
+            self._start = None
         self.redraw()
 
     def get_color(self):
-        if self.fraction < 0.5:
+        # the color of the fraction drawn, so it changes as the meter moves
+        if self._fraction < 0.5:
             return self.COLORS[0]
-        elif self.fraction < 0.75:
+        elif self._fraction < 0.75:
             return self.COLORS[1]
-        elif self.fraction < 0.90:
+        elif self._fraction < 0.90:
             return self.COLORS[2]
         else:
             return self.COLORS[3]
@@ -204,10 +325,10 @@ class StrengthMeter(gtk.DrawingArea):
 
 class StrengthMeterWithLabel(gtk.HBox):
 
-    def __init__(self):
+    def __init__(self, animate=False):
         super(StrengthMeterWithLabel, self).__init__()
 
-        self.meter = StrengthMeter()
+        self.meter = StrengthMeter(animate)
         self.meter.set_size_request(120, 8)
         self.alignment = gtk.Alignment(0.0, 0.5)
         self.alignment.add(self.meter)
@@ -219,8 +340,35 @@ class StrengthMeterWithLabel(gtk.HBox):
         self.pack_start(self.label)
         self.set_spacing(10)
 
+        self._checker = None
+        self._callback = None
+        self.connect("destroy", self._destroyed)
+
+    def _destroyed(self, widget):
+        if self._checker is not None:
+            self._checker.stop()
+            self._checker = None
+
     def set_fraction(self, fraction):
         self.meter.fraction = fraction
 
     def set_text(self, text):
         self.label.set_text(text)
+
+    def check_password(self, password, username=None, callback=None):
+        """Show the strength of password once typing stops, checking it in
+           the background.  If given, callback is called with the Password
+           as well, from the main loop.
+        """
+        if self._checker is None:
+            self._checker = PasswordChecker(self._checked)
+
+        self._callback = callback
+        self._checker.check(password, username)
+
+    def _checked(self, pw):
+        self.set_fraction(pw.strength_frac)
+        self.set_text(pw.pwq_msg or pw.strength_string)
+
+        if self._callback is not None:
+            self._callback(pw)
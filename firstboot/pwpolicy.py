@@ -0,0 +1,154 @@
+#
+# pwpolicy.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""The password policy firstboot enforces, without any UI, so that it can
+   be used to check passwords in bulk, for example before seeding accounts
+   on many systems:
+
+     for strength, strength_string, message in evaluate(pairs):
+         ...
+
+   where pairs are (username, password) tuples.
+"""
+
+import collections
+import multiprocessing
+import os
+import threading
+import pwquality
+
+import gettext
+_ = lambda x: gettext.ldgettext("firstboot", x)
+
+
+PWQUALITY_CONF = "/etc/security/pwquality.conf"
+
+# how many pairs a pool process is given at once
+CHUNKSIZE = 64
+
+
+def clamp(value, lowerbound, upperbound):
+    return min(max(value, lowerbound), upperbound)
+
+
+_settings = None
+_settings_mtime = None
+_settings_lock = threading.Lock()
+
+
+def get_settings():
+    """Return the PWQSettings read from pwquality.conf, shared by the whole
+       process and read again only when the file changes.
+    """
+    global _settings, _settings_mtime
+
+    try:
+        mtime = os.stat(PWQUALITY_CONF).st_mtime
+    except OSError:
+        mtime = None
+
+    with _settings_lock:
+        if _settings is None or mtime != _settings_mtime:
+            settings = pwquality.PWQSettings()
+            settings.read_config()
+            _settings, _settings_mtime = settings, mtime
+
+        return _settings
+
+
+class Password(object):
+
+    MIN_STRENGTH = 0
+    MAX_STRENGTH = 100
+
+    STRENGTH_STRINGS = [ _("Very weak"),
+                         _("Weak"),
+                         _("Fairly strong"),
+                         _("Strong"),
+                         _("Very strong") ]
+
+    def __init__(self, password, username=None):
+        self.password = password
+        self.username = username
+        self.pwq_settings = get_settings()
+
+        self.strength = self.MIN_STRENGTH
+        self.pwq_msg = ''
+        try:
+            self.strength = self.pwq_settings.check(self.password, None, self.username)
+        except pwquality.PWQError as (e, msg):
+            self.pwq_msg = msg
+
+        self.strength = clamp(self.strength, self.MIN_STRENGTH, self.MAX_STRENGTH)
+
+    @property
+    def strength_frac(self):
+        return float(self.strength) / self.MAX_STRENGTH
+
+    @property
+    def strength_string(self):
+        strings_count = len(self.STRENGTH_STRINGS)
+        index = int(self.strength / (self.MAX_STRENGTH / strings_count))
+
+        try:
+            return self.STRENGTH_STRINGS[index]
+        except IndexError:
+            return self.STRENGTH_STRINGS[-1]
+
+    def __str__(self):
+        return "%s" % self.password
+
+
+Result = collections.namedtuple("Result", "strength strength_string message")
+
+
+def check(username, password):
+    """Return the Result of checking one password."""
+    pw = Password(password, username)
+    return Result(pw.strength, pw.strength_string, pw.pwq_msg)
+
+
+def _check_pair(pair):
+    return check(*pair)
+
+
+def evaluate(pairs, processes=None, chunksize=CHUNKSIZE):
+    """Check each (username, password) pair of the iterable pairs, yielding
+       their Results in the same order as soon as they are known.  The
+       checks are spread over a pool of processes, as many as there are
+       CPUs unless given; with processes=1 they are made in this process.
+    """
+    if processes == 1:
+        for pair in pairs:
+            yield _check_pair(pair)
+        return
+
+    # The settings are read before forking, once for all the processes.
+    get_settings()
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(_check_pair, pairs, chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,101 @@
+#
+# startup.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from .concurrency import TaskGraph
+from .loader import Loader
+from .network import get_state
+from .tracing import span
+
+
+import logging
+log = logging.getLogger('firstboot.startup')
+
+
+class Startup:
+    """Brings up the display and loads the modules, overlapping whatever
+       doesn't depend on each other.  The phases and what they wait for:
+
+         set_lang      -- nothing
+         startx        -- set_lang
+         init_gtk      -- startx (run in the main thread, which is where
+                          gtk is used afterwards)
+         start_wm      -- init_gtk
+         merge_xres    -- init_gtk
+         network       -- nothing
+         discover      -- set_lang (module titles get translated)
+         load_modules  -- discover, network and init_gtk, as modules may
+                          import gtk (run in the main thread, which is
+                          where gtk is used afterwards)
+
+       Without a frontend, the display is already there and only the module
+       phases are run.
+    """
+
+    def __init__(self, frontend, module_dir, reconfig=False):
+        self.frontend = frontend
+        self.module_dir = module_dir
+        self.reconfig = reconfig
+
+        self.loader = None
+        self.modules = None
+
+    def _discover(self):
+        # the module index is tied to the language, so the loader can only
+        # be created once it is set
+        self.loader = Loader()
+        self.loader.discover(self.module_dir, self.reconfig)
+
+    def _load_modules(self):
+        self.modules = self.loader.load_modules(self.module_dir, self.reconfig)
+
+    def run(self):
+        graph = TaskGraph()
+        display = []
+
+        def add(name, func, **kwargs):
+            def phase():
+                with span(name, 'startup'):
+                    return func()
+            graph.add(name, phase, **kwargs)
+
+        if self.frontend is not None:
+            add('set_lang', self.frontend.set_lang)
+            add('startx', self.frontend.startx, after=['set_lang'])
+            add('init_gtk', self.frontend.init_gtk, after=['startx'],
+                mainThread=True)
+            add('start_wm', self.frontend.start_wm, after=['init_gtk'])
+            add('merge_xres', self.frontend.merge_xres, after=['init_gtk'])
+            display = ['init_gtk']
+
+        add('network', get_state().has_network)
+        add('discover', self._discover,
+            after=['set_lang'] if self.frontend is not None else [])
+        add('load_modules', self._load_modules,
+            after=['discover', 'network'] + display, mainThread=True)
+
+        graph.run()
+
+        for name in sorted(graph.durations, key=graph.durations.get,
+                           reverse=True):
+            log.debug('startup phase %s took %.3fs', name,
+                      graph.durations[name])
+        log.info('startup took %.3fs, %.3fs less than running the phases '
+                 'one after another', graph.wallTime, graph.savedTime)
+
+        return self.modules
@@ -0,0 +1,342 @@
+#
+# textinterface.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""The terminal frontend, for systems without a usable display.
+
+   Pages are shown one after another with the renderText method of their
+   modules, which asks its questions through the prompt, confirm and choose
+   methods of the interface and returns a RESULT_* value just like apply.
+   Modules that don't provide renderText are left out.  Navigating between
+   pages works as in the graphical interface: answering BACK to any
+   question goes back to the page before.
+"""
+
+import getpass
+import sys
+
+from .commit import RUNNING, CommitJournal
+from .constants import *
+from .lazy import wrap_module
+from .module import Module
+from .navigation import Navigator, TitleIndex
+from .profiling import profile
+from .tracing import span
+
+
+import logging
+log = logging.getLogger('firstboot.textinterface')
+
+import gettext
+_ = lambda x: gettext.ldgettext("firstboot", x)
+
+
+# what to answer to any question to go back to the page before
+BACK = '<'
+
+
+class GoBack(Exception):
+    """Raised by the prompts of TextInterface when the user asks to go back
+       to the page before.  Modules let it pass.
+    """
+    pass
+
+
+def supports_text(module):
+    """Does module provide its own renderText?"""
+    func = getattr(module.module.__class__, 'renderText', None)
+    return func is not None and \
+        getattr(func, 'im_func', func) is not Module.renderText.im_func
+
+
+class TextInterface(object):
+
+    def __init__(self, moduleList=[], testing=False, infile=None,
+                 outfile=None):
+        """Create a new TextInterface instance.  Instance attributes:
+
+           moduleList -- A list of references to all the loaded modules.
+           testing    -- Is firstboot running under testing mode, where no
+                         changes will be made to the disk?
+           infile     -- Where answers are read from, stdin by default.
+           outfile    -- Where pages are written to, stdout by default.
+        """
+        self.testing = testing
+        self.infile = infile if infile is not None else sys.stdin
+        self.outfile = outfile if outfile is not None else sys.stdout
+
+        self._nav = Navigator(realize=self._realize, removed=self._pageRemoved)
+        self._titleIndex = None
+
+        # Whether renderText moved to another page, and the page to show.
+        self._jumped = False
+        self._jumpTarget = None
+        self.moduleList = moduleList
+
+        # System changes registered by modules with registerCommit, made
+        # once the last page has been applied.
+        self.commits = CommitJournal()
+        self.commitWorkers = None
+        self._current = None
+
+    def _setModuleList(self, moduleList):
+        self._nav.setModuleList([wrap_module(m) for m in moduleList])
+        self._titleIndex = None
+
+    moduleList = property(lambda s: s._nav.moduleList,
+                          lambda s, v: s._setModuleList(v))
+
+    def _realize(self, module):
+        # Pages without a text version are dropped, like pages that fail to
+        # load in the graphical interface.
+        try:
+            if supports_text(module):
+                return True
+        except Exception as e:
+            log.error("Module %s raised an exception while loading: %s",
+                      module.title, e)
+            return False
+
+        log.info("Module %s has no text mode; skipping.", module.title)
+        return False
+
+    def _pageRemoved(self, level, pageNum):
+        self._titleIndex = None
+
+    def _getTitleIndex(self):
+        if self._titleIndex is None:
+            self._titleIndex = TitleIndex(self._nav.stack[0].moduleList)
+
+        return self._titleIndex
+
+    # Output and questions, for the renderText methods of modules.
+
+    def write(self, text=''):
+        self.outfile.write('%s\n' % text)
+        self.outfile.flush()
+
+    def _readline(self, question, secret=False):
+        while True:
+            if secret:
+                answer = getpass.getpass(question, stream=self.outfile)
+            else:
+                self.outfile.write(question)
+                self.outfile.flush()
+                answer = self.infile.readline()
+                if not answer:
+                    raise EOFError
+                answer = answer.rstrip('\n')
+
+            if answer.strip() != BACK:
+                return answer
+            elif self._nav.canGoBack():
+                raise GoBack()
+
+            # BACK is never taken as an answer
+            self.write(_("There is no previous page to go back to."))
+
+    def prompt(self, question, default=None, secret=False):
+        """Ask question and return the answer, or default if nothing was
+           entered and default is given.  With secret, what is typed isn't
+           shown.
+        """
+        if default is not None and not secret:
+            question = '%s [%s]' % (question, default)
+
+        while True:
+            answer = self._readline('%s: ' % question, secret)
+            if answer:
+                return answer
+            elif default is not None:
+                return default
+
+    def confirm(self, question, default=True):
+        """Ask a yes or no question.  Returns a bool."""
+        hint = _("Y/n") if default else _("y/N")
+        while True:
+            answer = self._readline('%s [%s] ' % (question, hint)).strip()
+            if not answer:
+                return default
+            elif answer.lower() in (_("y"), _("yes")):
+                return True
+            elif answer.lower() in (_("n"), _("no")):
+                return False
+
+    def choose(self, question, options, default=None):
+        """Ask to pick one of options, a list of strings.  Returns the index
+           of the option picked.
+        """
+        self.write(question)
+        for i, option in enumerate(options):
+            self.write('  %d) %s' % (i + 1, option))
+
+        hint = '' if default is None else ' [%d]' % (default + 1)
+        while True:
+            answer = self._readline('%s%s: ' % (_("Choice"), hint)).strip()
+            if not answer and default is not None:
+                return default
+
+            try:
+                index = int(answer) - 1
+            except ValueError:
+                continue
+
+            if 0 <= index < len(options):
+                return index
+
+    # Navigation, as in the graphical interface.
+
+    def moveToPage(self, moduleTitle=None, pageNum=None):
+        """Move to the page given either by title or page number, which is
+           shown once renderText returns RESULT_JUMP.  This method raises
+           SystemError if neither is provided, or if no page is found.
+        """
+        if moduleTitle is None and pageNum is None:
+            raise SystemError, _("moveToPage must be given a module title or page number.")
+
+        if moduleTitle is not None:
+            pageNum = self.titleToPageNum(moduleTitle, self.moduleList)
+
+        self._jumped = True
+        self._jumpTarget = self._nav.moveTo(pageNum)
+
+    def moveToTitle(self, moduleTitle):
+        """Move to the page with the given title, which may be in any
+           ModuleSet, shown once renderText returns RESULT_JUMP.  This
+           method raises SystemError if no page is found.
+        """
+        location = self.locateTitle(moduleTitle)
+
+        self._jumped = True
+        self._jumpTarget = self._nav.jump(*location)
+
+    def titleToPageNum(self, moduleTitle, moduleList):
+        """Lookup the given title in the given module list, like
+           Interface.titleToPageNum.  Returns the page number, or raises
+           SystemError if there is none.
+        """
+        index = self._getTitleIndex()
+        if index.knows(moduleList):
+            pageNum = index.page(moduleTitle, moduleList)
+        else:
+            pageNum = next((i for (i, m) in enumerate(moduleList)
+                            if m.title == moduleTitle), None)
+
+        if pageNum is None:
+            raise SystemError, _("No module exists with the title %s.") % moduleTitle
+
+        return pageNum
+
+    def locateTitle(self, moduleTitle):
+        """Lookup the given title in the top-level module list and all the
+           ModuleSets it contains, like Interface.locateTitle.  Returns a
+           tuple of the set path and the page number within the innermost
+           ModuleSet, or raises SystemError if no page has the title.
+        """
+        location = self._getTitleIndex().locate(moduleTitle)
+        if location is None:
+            raise SystemError, _("No module exists with the title %s.") % moduleTitle
+
+        return location
+
+    def registerCommit(self, name, func, after=(), description=None):
+        """Register a system change to be made once all the pages have been
+           applied, like Interface.registerCommit.
+        """
+        title = self._current.title if self._current is not None else None
+        self.commits.register(name, func, after, description, title)
+
+    def cancelCommit(self, name):
+        """Forget the change registered under name, if any."""
+        self.commits.cancel(name)
+
+    def _show(self, module):
+        self.write()
+        self.write('=' * 70)
+        if module.title:
+            self.write(_(module.title))
+            self.write('=' * 70)
+
+        self._current = module
+        try:
+            with span('renderText', 'module', module=module.name), \
+                 profile(module, 'renderText'):
+                return module.renderText(self)
+        finally:
+            self._current = None
+
+    def _commit(self):
+        if self.testing:
+            self.write()
+            self.write(_("These changes would be made:"))
+            self.write(self.commits.report())
+            return
+
+        def progress(action, finished, total):
+            if action.state == RUNNING:
+                self.write('[%d/%d] %s' % (finished + 1, total,
+                                           action.description))
+
+        self.write()
+        self.commits.run(self.commitWorkers, progress)
+
+    def checkReboot(self):
+        """Return whether any module requires a reboot for changes to take
+           effect, telling so.
+        """
+        for module in self._nav.stack[0].moduleList:
+            if module.needsReboot():
+                if not self.testing:
+                    self.write(_("The system must now reboot for some of your selections to take effect."))
+                    return True
+                break
+
+        return False
+
+    def run(self):
+        """Show the pages one after another until the last one is applied.
+           Returns whether the system needs to be rebooted.  EOFError is
+           raised if the input ends before that.
+        """
+        self.write(_("Answer %s to any question to go back to the previous page.") % BACK)
+
+        module = self._nav.moveTo(0)
+        if module is None:
+            log.error(_("No module could be displayed."))
+            return False
+
+        while module is not None:
+            try:
+                result = self._show(module)
+            except GoBack:
+                module = self._nav.back()
+                continue
+
+            jumped, self._jumped = self._jumped, False
+            if result == RESULT_FAILURE:
+                continue
+            elif result == RESULT_JUMP and jumped:
+                module = self._jumpTarget
+                continue
+
+            module = self._nav.next()
+
+        if len(self.commits) > 0:
+            self._commit()
+
+        return self.checkReboot()
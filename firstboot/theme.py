@@ -0,0 +1,114 @@
+#
+# theme.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import errno
+import os
+import threading
+
+
+import logging
+log = logging.getLogger('firstboot.theme')
+
+
+# upper bound for the decoded images kept in memory, in bytes
+CACHE_SIZE = 16 * 1024 * 1024
+
+
+def pick_theme(theme_root):
+    """Return the directory of the theme to use: the first one in
+       alphabetical order that isn't the default theme, or the default
+       theme if there is no other.
+    """
+    try:
+        themes = sorted(d for d in os.listdir(theme_root) if d != 'default')
+    except OSError as e:
+        log.error('could not list the themes: %s', e)
+        themes = []
+
+    if themes:
+        return os.path.join(theme_root, themes[0])
+    else:
+        return os.path.join(theme_root, 'default')
+
+
+class ThemeResolver:
+    """Finds the images of a theme, falling back to the default theme for
+       the ones the theme doesn't have.  Both directories are listed once,
+       when the resolver is created, and decoded images are kept in memory
+       up to cacheSize bytes, dropping the least recently used ones first.
+    """
+
+    def __init__(self, themeDir, defaultThemeDir, cacheSize=CACHE_SIZE):
+        self.themeDir = themeDir
+        self.defaultThemeDir = defaultThemeDir
+        self.cacheSize = cacheSize
+
+        # file name -> path, the theme overriding the default theme
+        self._files = {}
+        for directory in (defaultThemeDir, themeDir):
+            if directory is None:
+                continue
+
+            try:
+                names = os.listdir(directory)
+            except OSError as e:
+                log.warning('could not list theme directory %s: %s',
+                            directory, e)
+                continue
+
+            for name in names:
+                self._files[name] = os.path.join(directory, name)
+
+        self._pixbufs = collections.OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        """Return the path of the named theme file."""
+        try:
+            return self._files[name]
+        except KeyError:
+            raise IOError(errno.ENOENT, 'no theme provides %s' % name)
+
+    def pixbuf(self, name):
+        """Return the named image as a gtk.gdk.Pixbuf.  The same object is
+           returned for as long as it stays cached, so callers must not
+           modify it.
+        """
+        with self._lock:
+            pixbuf = self._pixbufs.pop(name, None)
+            if pixbuf is not None:
+                self._pixbufs[name] = pixbuf
+                return pixbuf
+
+        import gtk
+        pixbuf = gtk.gdk.pixbuf_new_from_file(self.path(name))
+        size = pixbuf.get_rowstride() * pixbuf.get_height()
+
+        with self._lock:
+            if name not in self._pixbufs:
+                self._pixbufs[name] = pixbuf
+                self._used += size
+
+            while self._used > self.cacheSize and len(self._pixbufs) > 1:
+                _name, old = self._pixbufs.popitem(last=False)
+                self._used -= old.get_rowstride() * old.get_height()
+
+        return pixbuf
@@ -0,0 +1,137 @@
+#
+# tracing.py
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Timing of the startup and of the module calls, written out at exit in
+   the trace event format read by chrome://tracing and similar viewers.
+
+   Tracing is off unless enable() is called or FIRSTBOOT_TRACE is set to
+   the file to write to.  While it is off, span() returns a shared object
+   that does nothing, so instrumented code costs a function call.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+
+import logging
+log = logging.getLogger('firstboot.tracing')
+
+
+ENV_VAR = 'FIRSTBOOT_TRACE'
+
+_path = None
+_events = []
+_threads = {}
+_epoch = time.time()
+
+
+class _NullSpan(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span(object):
+
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.time()
+        thread = threading.current_thread()
+        _threads.setdefault(thread.ident, thread.name)
+        # list.append is atomic, no lock needed
+        _events.append((self.name, self.cat, self.args, self.start, end,
+                        thread.ident))
+        return False
+
+
+def enabled():
+    return _path is not None
+
+
+def enable(path):
+    """Start recording spans, to be written to path when firstboot exits."""
+    global _path
+
+    if _path is None:
+        atexit.register(write)
+    _path = path
+
+
+def span(name, cat='firstboot', **args):
+    """Return a context manager recording the time spent in its block as
+       a span called name.  Keyword arguments are shown with the span.
+    """
+    if _path is None:
+        return _null_span
+
+    return _Span(name, cat, args)
+
+
+def write():
+    """Write the spans recorded so far to the trace file."""
+    if _path is None:
+        return
+
+    pid = os.getpid()
+    events = []
+    for ident, name in _threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                       'tid': ident, 'args': {'name': name}})
+
+    for name, cat, args, start, end, ident in list(_events):
+        events.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid,
+                       'tid': ident,
+                       'ts': int((start - _epoch) * 1000000),
+                       'dur': int((end - start) * 1000000),
+                       'args': args})
+
+    try:
+        with open(_path, 'w') as fobj:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fobj)
+    except (IOError, OSError) as e:
+        log.error('could not write the trace to %s: %s', _path, e)
+        return
+
+    log.info('wrote %d spans to %s', len(events) - len(_threads), _path)
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])